@@ -1,6 +1,8 @@
 import streamlit as st
 import streamlit.components.v1 as components
-import nltk
+
+from speakable.resources import install_dependencies, start_metrics_exporter, start_warmup
+from speakable.llm import DEFAULT_MODEL
 
 st.image("images/speakable_logo.png", caption="")
 
@@ -8,17 +10,10 @@ if st.session_state.get("show_success", False):
     st.session_state.show_success = True  
     
 if "selected_model" not in st.session_state:
-    st.session_state["selected_model"] = "gemini-1.5-flash"
-
-@st.cache_data(show_spinner="Downloading dependencies...")
-def install_dependencies():
-    try:
-        nltk.data.find('tokenizers/punkt')
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        nltk.download('punkt')
-        nltk.download('punkt_tab')
+    st.session_state["selected_model"] = DEFAULT_MODEL
 
+start_warmup()
+start_metrics_exporter()
 install_dependencies()
 
 # Title Section
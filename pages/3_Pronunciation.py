@@ -2,36 +2,25 @@ import streamlit as st
 from nltk.tokenize import sent_tokenize
 from streamlit_mic_recorder import mic_recorder
 
-import torch
-import torchaudio
-import ffmpeg
-import phonemizer
-import Levenshtein
-import pydub
-import nltk
-from io import BytesIO
-from pydub import AudioSegment
-from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+from contextlib import nullcontext
 
 import os
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
 from google.api_core.exceptions import ResourceExhausted
 
+from speakable.resources import install_dependencies, load_pronunciation_service, start_metrics_exporter, start_warmup
+from speakable.llm import DEFAULT_MODEL, ModelsExhausted
+from speakable.metrics import METRICS
+from speakable.prompts import PromptTooLarge
+from speakable.service import Overloaded
+from speakable.startup import load_inference_engine, speech_model_ready
+
 st.markdown("### Pronunciation")
 
 if "show_success" not in st.session_state:
     st.session_state.show_success = True
 
-@st.cache_data(show_spinner="Downloading dependencies...")
-def install_dependencies():
-    try:
-        nltk.data.find('tokenizers/punkt')
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        nltk.download('punkt')
-        nltk.download('punkt_tab')
-
+start_warmup()
+start_metrics_exporter()
 install_dependencies()
 
 @st.cache_data  
@@ -61,97 +50,78 @@ else:
         height=300
     )
 
-@st.cache_resource(show_spinner="Loading speech model... Please be patient.")
-def load_model_ipa_model():
-    processor = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-lv-60-espeak-cv-ft")
-    model = Wav2Vec2ForCTC.from_pretrained("facebook/wav2vec2-lv-60-espeak-cv-ft")
-    return processor, model
-
-load_dotenv()
 
 os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
 
 if "selected_model" not in st.session_state:
-    st.session_state["selected_model"] = "gemini-1.5-flash"
-
-llm = ChatGoogleGenerativeAI(model=st.session_state["selected_model"])
-
-def generate_feedback(human, ipa, sentence, ratio, contents_str):
-    prompt = f"""
-    Given the following ipa transcription that has been generated from the audio file: {human}.
-
-    The user is trying to say the word: \"{sentence}\" and in ipa transcription, it is: {ipa}. The provided IPA transcription is modified to include spaces between each character.
-
-    The similarity between the ipa transcription and the phonemes is: {ratio}.
-    The user's native language is English, the user's target language is English, and the user's efficiency level is Beginner. See below the differences between the ipa transcription and the phonemes: {contents_str}
-
-    Your return should be in the following format:
-    \\n- Word that was mispronounced: description of how to improve pronunciation of word and what the word sounds like in simple transcription, like for the word \"How\" it can be pronounced as \"ow\".
-
-    \\n- Lastly you should return a score to the user and why they achieved this score.
-
-    Strictly ensure you follow the above format.
-    Strictly ensure that you do not include any ipa transcription or complex symbols in your return, instead replace it with the actual part of the word or sentence for better understanding.
-    """
-    
-    messages = [
-        ("system", prompt),
-        ("human", human),
-    ]
-    
+    st.session_state["selected_model"] = DEFAULT_MODEL
+
+pronunciation_service = load_pronunciation_service()
+
+SESSION_RESULTS = 32
+
+def cached_result(key, compute):
+    # Streamlit reruns the page on every interaction while the last recording is still set, so
+    # results are kept in the session as well as in the service's cache shared by all sessions.
+    results = st.session_state.setdefault("pronunciation_results", {})
+    counts = st.session_state.setdefault("pronunciation_cache", {"session_hits": 0, "service_calls": 0})
+    if key in results:
+        counts["session_hits"] += 1
+        METRICS.inc("cache_lookups_total", cache="pronunciation_session", result="memory_hit")
+        return results[key]
+
+    counts["service_calls"] += 1
+    value = compute()
+    if value is None:
+        return None
+    results[key] = value
+    while len(results) > SESSION_RESULTS:
+        results.pop(next(iter(results)))
+    return value
+
+def assess(audio_bytes, sentence):
+    placeholder = st.empty()
+
+    def show_partial(event):
+        if event["event"] == "partial":
+            placeholder.caption(f"Recognised so far: {event['ipa']}")
+
+    # The model is loading in the background; only the first recordings after a restart wait for it.
+    loading = nullcontext() if speech_model_ready() else st.spinner("Loading speech model... Please be patient.")
     try:
-        st.info("**Feedback**\n" + llm.invoke(messages).content)
-    except ResourceExhausted as e:
+        with loading:
+            return pronunciation_service.assess(audio_bytes, sentence, on_event=show_partial)
+    except Overloaded as e:
+        st.warning("Speakable is busy scoring other recordings. Please try again in a moment.")
+        return None
+    finally:
+        placeholder.empty()
+
+def generate_feedback(result, sentence):
+    try:
+        feedback, prompt = pronunciation_service.feedback(result, sentence, st.session_state["selected_model"])
+        return {"feedback": feedback, "prompt": prompt}
+    except PromptTooLarge as e:
+        st.warning("This sentence is too long for the AI coach. Please practise a shorter sentence.")
+        return None
+    except ValueError as e:
+        # The assessment was evicted from the shared cache since it was shown.
+        st.warning("This recording has expired. Please record the sentence again.")
+        return None
+    except Overloaded as e:
+        st.warning("Speakable is busy giving feedback to other users. Please try again in a moment.")
+        return None
+    except (ResourceExhausted, ModelsExhausted) as e:
+        METRICS.inc("exhausted_requests_total", page="pronunciation")
         st.warning(
-            "The model that is analysing your text is currently exhausted. Please go to the **Settings** tab and select a different model."
+            "All models that can give feedback are currently exhausted. Please try again in a minute."
         )
-        
-def phonemize_audio(audio):
-    waveform, sample_rate = torchaudio.load(audio)
-
-    if sample_rate != 16000:
-        resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
-        waveform = resampler(waveform)
-
-    processor, model = load_model_ipa_model()
-    inputs = processor(waveform.squeeze().numpy(), sampling_rate=16000, return_tensors="pt", padding=True)
-    with torch.no_grad():
-        logits = model(**inputs).logits
-
-    predicted_human_ipa = torch.argmax(logits, dim=-1)
-    human = processor.batch_decode(predicted_human_ipa)[0]
-    human = human.replace(":", "").replace("'", "").replace("ˌ", "").removeprefix(" ").removesuffix(" ")
-    
-    return human
-
-def generate_content_str(human, ipa, non_matching):
-    contents = []
-    for tag, i1, i2, j1, j2 in non_matching:
-        if tag == 'equal':
-            contents.append(('equal',human[i1:i2]))
-        elif tag == 'replace':
-            contents.append(('replace',human[i1:i2], ipa[j1:j2]))
-        elif tag == 'delete':
-            contents.append(('delete',human[i1:i2]))
-        elif tag == 'insert':
-            contents.append(('insert',ipa[j1:j2]))
-    
-    contents_str = "The key differences in the string are highlighted below: "
-    for tag, *args in contents:
-        if tag == 'equal':
-            contents_str += f" Same({args[0]}), "
-        elif tag == 'replace':
-            contents_str += f" Replace({args[0]} with {args[1]}), "
-        elif tag == 'delete':
-            contents_str += f" Delete({args[0]}), "
-        elif tag == 'insert':
-            contents_str += f" Insert({args[0]}), "
-    contents_str = contents_str.removesuffix(", ")
-    
-    return contents_str
+        return None
 
 if human:
     sentences = sent_tokenize(human)
+    # Reference phonemes for every sentence are prepared while the user reads the text.
+    pronunciation_service.reference_ipa(sentences)
 
     with st.container():
         st.markdown("### Pronunciation Practice")
@@ -171,23 +141,50 @@ if human:
     if audio:
         st.audio(audio["bytes"])
 
-        audio_segment = pydub.AudioSegment.from_file(BytesIO(audio["bytes"]))
-        wav_io = BytesIO()
-        audio_segment.export(wav_io, format="wav")
-        wav_io.seek(0)
-        
-        human_ipa = phonemize_audio(wav_io)
-        ipa = phonemizer.phonemize(selected_sentence, language="en-us", backend="espeak")
-        ipa = ipa.replace(":", "").replace("'", "").replace("ˌ", "").strip()
-        ratio = Levenshtein.ratio(human_ipa, ipa)
-        ops = Levenshtein.editops(human_ipa, ipa)
-        matching = Levenshtein.matching_blocks(ops, human_ipa, ipa)
-        non_matching = Levenshtein.opcodes(ops, human_ipa, ipa)
-        contents_str = generate_content_str(human_ipa, ipa, non_matching)
-        
+        key = pronunciation_service.key(audio["bytes"], selected_sentence)
+        result = cached_result(key, lambda: assess(audio["bytes"], selected_sentence))
+        if result is None:
+            st.stop()
+        score = result["score"]
+        word_scores = result["word_scores"]
+
+        st.markdown("### Pronunciation Score")
+        if score > 49:
+            st.success(f"Score: **{score:.0f}**")
+        else:
+            st.warning(f"Score: **{score:.0f}**")
+        st.dataframe(
+            [
+                {"Word": word, "Score": round(word_score), "Start (s)": start_time, "End (s)": end_time}
+                for _, word, word_score, start_time, end_time in word_scores
+            ],
+            hide_index=True
+        )
+
         st.write("")
-        generate_feedback(human_ipa, ipa, selected_sentence, ratio, contents_str)
-        
+        if not result["low_scoring"]:
+            st.success("Every word was pronounced clearly. Well done!")
+        elif st.checkbox("Ask the AI coach how to improve the highlighted words", key=f"coach_{selected_index}"):
+            feedback = cached_result(
+                f"{key}:feedback:{st.session_state['selected_model']}",
+                lambda: generate_feedback(result, selected_sentence)
+            )
+            if feedback is not None:
+                st.info("**Feedback**\n" + feedback["feedback"])
+                if feedback["prompt"]["requests"]:
+                    st.caption(f"Prompt: about {feedback['prompt']['total_tokens']} tokens.")
+
+        with st.expander("Inference statistics"):
+            st.markdown("**Stage timings (ms)**")
+            st.json({stage: round(seconds * 1000, 1) for stage, seconds in result["timings"].items()})
+            if result["voice_activity"] is not None:
+                st.markdown("**Voice activity**")
+                st.json(result["voice_activity"])
+            st.markdown("**Result cache**")
+            st.json({**st.session_state["pronunciation_cache"], "service": pronunciation_service.stats()})
+            if speech_model_ready():
+                st.markdown("**Batching**")
+                st.json(load_inference_engine().stats())
 
 else:
     st.warning("Please paste in your text in the text field above. If you are using unreviewed text, please analyse your text first using **Text Analysis**.")
@@ -1,37 +1,47 @@
 from nltk.tokenize import sent_tokenize
-from gtts import gTTS
 import streamlit as st
-import tempfile
-import nltk
+import os
 
-@st.cache_data(show_spinner="Downloading dependencies...")
-def install_dependencies():
-    try:
-        nltk.data.find('tokenizers/punkt')
-        nltk.data.find('tokenizers/punkt_tab')
-    except LookupError:
-        nltk.download('punkt')
-        nltk.download('punkt_tab')
+from speakable.resources import install_dependencies, start_metrics_exporter, start_warmup
+from speakable.metrics import METRICS
+from speakable.tts import TTS_BACKENDS, AudioStore, Synthesizer
 
+start_warmup()
+start_metrics_exporter()
 install_dependencies()
 
+# Shared by every session, so a sentence is only synthesised once for the whole server.
+@st.cache_resource
+def load_synthesizer():
+    backend = TTS_BACKENDS[os.getenv("SPEAKABLE_TTS_BACKEND", "gtts")]()
+    store = AudioStore(max_bytes=int(os.getenv("SPEAKABLE_TTS_CACHE_MB", "200")) * 1024 * 1024)
+    return Synthesizer(
+        backend,
+        store,
+        language=os.getenv("SPEAKABLE_TTS_LANGUAGE", "en"),
+        voice=os.getenv("SPEAKABLE_TTS_VOICE") or None,
+        max_workers=int(os.getenv("SPEAKABLE_TTS_WORKERS", "4"))
+    )
+
 st.markdown("### Annotation")
 st.info("This section helps you present your text clearly using state-of-the-art Text-to-Speech models. It focuses on improving pronunciation, but does not reflect tone, engagement, or emotional expression.")
 
 if "reviewed_text" in st.session_state:
     text = st.session_state["reviewed_text"]
     sentences = sent_tokenize(text)
+    synthesizer = load_synthesizer()
 
+    players = []
     for i, sentence in enumerate(sentences):
-        st.markdown(f"**Sentence {i+1}**: {sentence}")    
-         
-        with tempfile.NamedTemporaryFile(suffix=".mp3") as tmp:
-            gTTS(sentence).save(tmp.name)
-            tmp.seek(0)
-            audio_bytes = tmp.read()
-            st.audio(audio_bytes, format="audio/mp3")
-            
+        st.markdown(f"**Sentence {i+1}**: {sentence}")
+        players.append(st.empty())
+        players[-1].caption("Generating audio...")
         st.divider()
+
+    # Players are filled in as soon as each clip is ready rather than in sentence order.
+    with METRICS.span("annotation", profile=True, page="annotation"):
+        for i, audio_bytes in synthesizer.synthesize_many(sentences):
+            players[i].audio(audio_bytes, format=f"audio/{synthesizer.format}")
         
 else:
     st.warning("No text to synthesize. Please review and submit your text first using **Text Analysis** to activate this tab.")
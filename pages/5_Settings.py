@@ -1,14 +1,13 @@
 import streamlit as st
 
-st.markdown("### Settings")
+from speakable.resources import load_router, start_warmup
+from speakable.llm import MODELS as models
+from speakable.metrics import METRICS
+from speakable.startup import startup_report
+
+start_warmup()
 
-models = {
-    "Gemini 1.5 Pro": "gemini-1.5-pro",
-    "Gemini 1.5 Flash": "gemini-1.5-flash",
-    "Gemini 1.5 Flash-8B": "gemini-1.5-flash-8b",
-    "Gemini 2.0 Flash": "gemini-2.0-flash",
-    "Gemini 2.0 Flash-Lite": "gemini-2.0-flash-lite"
-}
+st.markdown("### Settings")
 
 def get_model_name_by_value(value):
     for name, val in models.items():
@@ -31,5 +30,24 @@ st.session_state["selected_model"] = models[selected_model_name]
 
 st.success(f"Selected: {selected_model_name} (`{models[selected_model_name]}`)")
 
+st.markdown("### Model Status")
+router_stats = load_router().stats()
+st.dataframe(
+    [
+        {"Model": get_model_name_by_value(model) if model in models.values() else model, **status}
+        for model, status in router_stats["models"].items()
+    ],
+    hide_index=True
+)
+st.caption(f"Requests served by a fallback model: {router_stats['fallbacks']}")
+
+with st.expander("Startup timings"):
+    st.json(startup_report())
+
+with st.expander("Metrics"):
+    st.json(METRICS.snapshot())
+    st.code(METRICS.prometheus(), language="text")
+
 st.markdown("### FAQ")
 st.info("Gemini 1.5 Flash is the recommended model for this application.")
+st.info("If the selected model is exhausted, requests are automatically retried on the next available model in the list above.")
@@ -0,0 +1,271 @@
+import re
+import threading
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+
+Alignment = namedtuple("Alignment", ["spoken", "reference", "distance", "ratio", "opcodes", "words"])
+WordAlignment = namedtuple("WordAlignment", ["word", "reference", "spoken", "ops", "score"])
+
+STRESS_MARKS = {"ˈ", "ˌ", "'"}
+MODIFIERS = {"ː", "ˑ", "ʰ", "ʲ", "ʷ", "ˠ", "ˤ", "̃", "̩", "̯", "̥", "̬"}
+
+# Sequences espeak and the wav2vec2 vocabulary treat as one phoneme.
+MULTI_SEGMENT = {"tʃ", "dʒ", "aɪ", "aʊ", "eɪ", "oʊ", "ɔɪ", "əʊ", "ɪə", "eə", "ʊə", "aɪə", "aʊə"}
+
+# Consonants as (voiced, place, manner) and vowels as (height, backness, rounded), each scaled
+# to [0, 1]. Places run bilabial to glottal; manners run plosive, affricate, fricative, nasal,
+# lateral, approximant, tap, trill.
+CONSONANTS = {
+    "p": (0, 0, 0), "b": (1, 0, 0), "t": (0, 3, 0), "d": (1, 3, 0), "ʈ": (0, 5, 0), "ɖ": (1, 5, 0),
+    "c": (0, 6, 0), "ɟ": (1, 6, 0), "k": (0, 7, 0), "g": (1, 7, 0), "ɡ": (1, 7, 0), "q": (0, 8, 0),
+    "ʔ": (0, 9, 0), "tʃ": (0, 4, 1), "dʒ": (1, 4, 1),
+    "f": (0, 1, 2), "v": (1, 1, 2), "θ": (0, 2, 2), "ð": (1, 2, 2), "s": (0, 3, 2), "z": (1, 3, 2),
+    "ʃ": (0, 4, 2), "ʒ": (1, 4, 2), "ç": (0, 6, 2), "x": (0, 7, 2), "ɣ": (1, 7, 2), "χ": (0, 8, 2),
+    "ʁ": (1, 8, 2), "h": (0, 9, 2), "ɦ": (1, 9, 2),
+    "m": (1, 0, 3), "ɱ": (1, 1, 3), "n": (1, 3, 3), "ɳ": (1, 5, 3), "ɲ": (1, 6, 3), "ŋ": (1, 7, 3),
+    "l": (1, 3, 4), "ɫ": (1, 3, 4), "ɭ": (1, 5, 4), "ʎ": (1, 6, 4),
+    "ɹ": (1, 3, 5), "ɻ": (1, 5, 5), "j": (1, 6, 5), "w": (1, 0, 5), "ʋ": (1, 1, 5),
+    "ɾ": (1, 3, 6), "r": (1, 3, 7),
+}
+VOWELS = {
+    "i": (0, 0, 0), "y": (0, 0, 1), "ɨ": (0, 2, 0), "ʉ": (0, 2, 1), "ɯ": (0, 4, 0), "u": (0, 4, 1),
+    "ɪ": (1, 0.5, 0), "ʏ": (1, 0.5, 1), "ᵻ": (1, 2, 0), "ʊ": (1, 3.5, 1),
+    "e": (2, 0, 0), "ø": (2, 0, 1), "ɘ": (2, 2, 0), "ɵ": (2, 2, 1), "ɤ": (2, 4, 0), "o": (2, 4, 1),
+    "ə": (3, 2, 0), "ɚ": (3, 2, 0), "ɛ": (4, 0, 0), "œ": (4, 0, 1), "ɜ": (4, 2, 0), "ɝ": (4, 2, 0),
+    "ʌ": (4, 4, 0), "ɔ": (4, 4, 1), "æ": (5, 0, 0), "ɐ": (5, 2, 0),
+    "a": (6, 0.5, 0), "ɶ": (6, 0, 1), "ɑ": (6, 4, 0), "ɒ": (6, 4, 1),
+}
+
+
+def _is_modifier(char):
+    return char in MODIFIERS or unicodedata.combining(char) != 0
+
+
+def split_words(ipa):
+    # Splits an IPA transcription into words of phoneme tokens. Stress marks are dropped, length
+    # marks and diacritics stay attached to their phoneme and MULTI_SEGMENT sequences are merged.
+    words = []
+    for word in ipa.split():
+        segments = []
+        for char in word:
+            if char in STRESS_MARKS:
+                continue
+            if segments and _is_modifier(char):
+                segments[-1] += char
+            else:
+                segments.append(char)
+
+        tokens, k = [], 0
+        while k < len(segments):
+            for size in (3, 2, 1):
+                candidate = "".join(segments[k:k + size])
+                if size == 1 or (k + size <= len(segments) and _base(candidate) in MULTI_SEGMENT):
+                    tokens.append(candidate)
+                    k += size
+                    break
+        if tokens:
+            words.append(tokens)
+    return words
+
+
+def _base(token):
+    return "".join(char for char in token if not _is_modifier(char))
+
+
+def _features(token):
+    base = _base(token)
+    if base in CONSONANTS:
+        voiced, place, manner = CONSONANTS[base]
+        return "consonant", np.array([voiced, place / 9, manner / 7])
+    parts = [VOWELS[char] for char in base if char in VOWELS]
+    if parts and len(parts) == len(base):
+        height, backness, rounded = np.mean(parts, axis=0)
+        return "vowel", np.array([height / 6, backness / 4, rounded, float("ː" in token)])
+    return None, None
+
+
+def substitution_cost(a, b):
+    if a == b:
+        return 0.0
+    kind_a, features_a = _features(a)
+    kind_b, features_b = _features(b)
+    if kind_a is None or kind_a != kind_b:
+        return 1.0
+    if kind_a == "consonant":
+        distance = np.dot([0.25, 0.4, 0.35], np.abs(features_a - features_b))
+    else:
+        distance = np.dot([0.45, 0.35, 0.1, 0.1], np.abs(features_a - features_b))
+    return float(min(1.0, 0.2 + 0.8 * distance))
+
+
+class PhonemeInventory:
+    # Maps phoneme tokens to integer ids and keeps the matrix of substitution costs between all
+    # ids seen so far, growing it when new tokens appear.
+
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+        self.costs = np.zeros((0, 0))
+        self._lock = threading.Lock()
+
+    def encode(self, tokens):
+        with self._lock:
+            added = [token for token in dict.fromkeys(tokens) if token not in self.ids]
+            if added:
+                for token in added:
+                    self.ids[token] = len(self.tokens)
+                    self.tokens.append(token)
+                size = len(self.tokens)
+                costs = np.ones((size, size))
+                costs[:len(self.costs), :len(self.costs)] = self.costs
+                for new in range(size - len(added), size):
+                    for other in range(size):
+                        cost = substitution_cost(self.tokens[new], self.tokens[other])
+                        costs[new, other] = costs[other, new] = cost
+                self.costs = costs
+            return np.array([self.ids[token] for token in tokens], dtype=np.int64)
+
+
+_inventory = PhonemeInventory()
+
+
+def _distance_tables(spoken_ids, reference_ids, costs, insert_cost, delete_cost):
+    # Weighted edit distance for a batch of padded id sequences. Rows are filled one spoken
+    # phoneme at a time for every pair at once; within a row the left-to-right insertion chain is
+    # resolved with a running minimum, so no Python loop runs over reference phonemes.
+    batch, rows = spoken_ids.shape
+    columns = reference_ids.shape[1]
+    steps = np.arange(columns + 1) * insert_cost
+
+    tables = np.empty((batch, rows + 1, columns + 1))
+    tables[:, 0, :] = steps
+    candidate = np.empty((batch, columns + 1))
+    for i in range(1, rows + 1):
+        previous = tables[:, i - 1, :]
+        substitution = costs[spoken_ids[:, i - 1][:, None], reference_ids]
+        candidate[:, 0] = previous[:, 0] + delete_cost
+        np.minimum(previous[:, 1:] + delete_cost, previous[:, :-1] + substitution, out=candidate[:, 1:])
+        tables[:, i, :] = np.minimum.accumulate(candidate - steps, axis=1) + steps
+    return tables
+
+
+def _backtrace(table, spoken_ids, reference_ids, costs, insert_cost, delete_cost):
+    i, j = len(spoken_ids), len(reference_ids)
+    ops = []
+    while i > 0 or j > 0:
+        if i > 0 and j > 0:
+            cost = costs[spoken_ids[i - 1], reference_ids[j - 1]]
+            if np.isclose(table[i, j], table[i - 1, j - 1] + cost):
+                ops.append(("equal" if cost == 0 else "replace", i - 1, j - 1))
+                i, j = i - 1, j - 1
+                continue
+        if i > 0 and np.isclose(table[i, j], table[i - 1, j] + delete_cost):
+            ops.append(("delete", i - 1, j))
+            i -= 1
+        else:
+            ops.append(("insert", i, j - 1))
+            j -= 1
+    ops.reverse()
+    return ops
+
+
+def _opcodes(ops):
+    # Groups single-phoneme operations into (tag, i1, i2, j1, j2) ranges over the token lists, the
+    # same shape as difflib and Levenshtein opcodes.
+    opcodes = []
+    for tag, i, j in ops:
+        i2 = i + (tag != "insert")
+        j2 = j + (tag != "delete")
+        if opcodes and opcodes[-1][0] == tag and opcodes[-1][2] == i and opcodes[-1][4] == j:
+            opcodes[-1] = (tag, opcodes[-1][1], i2, opcodes[-1][3], j2)
+        else:
+            opcodes.append((tag, i, i2, j, j2))
+    return opcodes
+
+
+def _word_alignments(ops, spoken, reference, reference_words, words, costs, spoken_ids, reference_ids, insert_cost, delete_cost):
+    word_of = np.repeat(np.arange(len(reference_words)), [len(word) for word in reference_words])
+    per_word = [[] for _ in reference_words]
+    penalties = [0.0] * len(reference_words)
+    for tag, i, j in ops:
+        if not len(word_of):
+            break
+        # Extra spoken phonemes belong to the word of the reference phoneme they follow.
+        word = word_of[max(0, min(j - (tag == "delete"), len(word_of) - 1))]
+        if tag == "insert":
+            per_word[word].append((tag, "", reference[j]))
+            penalties[word] += insert_cost
+        elif tag == "delete":
+            per_word[word].append((tag, spoken[i], ""))
+            penalties[word] += delete_cost
+        else:
+            per_word[word].append((tag, spoken[i], reference[j]))
+            penalties[word] += float(costs[spoken_ids[i], reference_ids[j]])
+
+    if words is None or len(words) != len(reference_words):
+        words = [None] * len(reference_words)
+
+    return [
+        WordAlignment(
+            word,
+            "".join(tokens),
+            "".join(token for _, token, _ in word_ops),
+            word_ops,
+            max(0.0, 1 - penalty / len(tokens))
+        )
+        for word, tokens, word_ops, penalty in zip(words, reference_words, per_word, penalties)
+    ]
+
+
+def align_batch(pairs, words=None, insert_cost=1.0, delete_cost=1.0, inventory=None):
+    # Aligns (spoken_ipa, reference_ipa) pairs in one vectorised pass. words optionally gives the
+    # written words of each reference so that word alignments can name them.
+    inventory = inventory or _inventory
+    spoken_words = [split_words(spoken) for spoken, _ in pairs]
+    reference_words = [split_words(reference) for _, reference in pairs]
+    spoken = [[token for word in sentence for token in word] for sentence in spoken_words]
+    reference = [[token for word in sentence for token in word] for sentence in reference_words]
+
+    spoken_ids = [inventory.encode(tokens) for tokens in spoken]
+    reference_ids = [inventory.encode(tokens) for tokens in reference]
+    costs = inventory.costs
+
+    rows = max((len(ids) for ids in spoken_ids), default=0)
+    columns = max((len(ids) for ids in reference_ids), default=0)
+    padded_spoken = np.zeros((len(pairs), rows), dtype=np.int64)
+    padded_reference = np.zeros((len(pairs), columns), dtype=np.int64)
+    for k, (a, b) in enumerate(zip(spoken_ids, reference_ids)):
+        padded_spoken[k, :len(a)] = a
+        padded_reference[k, :len(b)] = b
+
+    # Cells beyond a pair's own lengths only depend on padding and are never read back.
+    tables = _distance_tables(padded_spoken, padded_reference, costs, insert_cost, delete_cost)
+
+    alignments = []
+    for k in range(len(pairs)):
+        a, b = spoken_ids[k], reference_ids[k]
+        distance = float(tables[k, len(a), len(b)])
+        ops = _backtrace(tables[k], a, b, costs, insert_cost, delete_cost)
+        longest = max(len(a), len(b))
+        alignments.append(Alignment(
+            spoken[k],
+            reference[k],
+            distance,
+            max(0.0, 1 - distance / longest) if longest else 1.0,
+            _opcodes(ops),
+            _word_alignments(
+                ops, spoken[k], reference[k], reference_words[k], words[k] if words else None,
+                costs, a, b, insert_cost, delete_cost
+            )
+        ))
+    return alignments
+
+
+def align(spoken, reference, words=None, **options):
+    return align_batch([(spoken, reference)], [words] if words is not None else None, **options)[0]
+
+
+def written_words(sentence):
+    return re.findall(r"[\w'’-]+", sentence)
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from urllib.parse import parse_qs
+
+# Loads .env before the imports below read their settings from the environment.
+import speakable.env
+from speakable.llm import DEFAULT_MODEL, ModelsExhausted, is_quota_error
+from speakable.metrics import METRICS
+from speakable.service import Overloaded, PronunciationService, TextAnalysisService, router_from_env
+
+# An ASGI app over the Text Analysis and Pronunciation services, for clients without a browser
+# session and for load tests. Long requests answer with newline-delimited JSON events ("accepted",
+# "partial", "correction", then "result" or "error") as they happen.
+#
+#   uvicorn --factory speakable.api:create_app --port 8000
+#
+#   POST /text-analysis              {"text": "...", "model": "gemini-1.5-flash"}
+#   POST /pronunciation?sentence=... raw recording bytes (wav, webm, ...)
+#   POST /pronunciation/feedback     {"result": {...}, "sentence": "...", "model": "..."}
+#   GET  /health, GET /metrics
+
+MAX_BODY_BYTES = 20 * 1024 * 1024
+MAX_PENDING_EVENTS = 16
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+
+def _error_for(error):
+    if isinstance(error, HTTPError):
+        return error
+    if isinstance(error, Overloaded):
+        return HTTPError(503, str(error), [(b"retry-after", b"1")])
+    if isinstance(error, ModelsExhausted) or is_quota_error(error):
+        return HTTPError(429, "All models are currently exhausted.", [(b"retry-after", b"60")])
+    if isinstance(error, (ValueError, KeyError, TypeError)):
+        return HTTPError(400, str(error))
+    logger.error("Request failed", exc_info=error)
+    return HTTPError(500, "Internal error.")
+
+
+async def read_body(receive, limit=MAX_BODY_BYTES):
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Client disconnected.")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise HTTPError(413, f"Request body is larger than {limit} bytes.")
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, value, headers=()):
+    body = json.dumps(value, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def stream_events(limiter, fn, *args, **kwargs):
+    # Runs fn(*args, on_event=..., **kwargs) on the limiter's threads and yields its events,
+    # followed by a final {"event": "result", "result": ...}. The event queue is bounded, so a
+    # client that reads slowly holds the worker back instead of events piling up in memory.
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(MAX_PENDING_EVENTS)
+    closed = threading.Event()
+    done = object()
+
+    def emit(event):
+        if not closed.is_set():
+            asyncio.run_coroutine_threadsafe(queue.put(event), loop).result()
+
+    async def run():
+        try:
+            return await limiter.run(fn, *args, on_event=emit, **kwargs)
+        finally:
+            await queue.put(done)
+
+    task = asyncio.create_task(run())
+    # Retrieves the exception of a run whose client disconnected, so it is not reported as lost.
+    task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    try:
+        while (event := await queue.get()) is not done:
+            yield event
+        yield {"event": "result", "result": await task}
+    finally:
+        # A client that went away must not leave the worker blocked on a full queue.
+        closed.set()
+        while not queue.empty():
+            queue.get_nowait()
+
+
+async def send_events(send, events):
+    # The response only starts once the first event is in, so requests that are turned away
+    # (overloaded, invalid) still get a proper status code.
+    try:
+        first = await anext(events)
+    except Exception as e:
+        await events.aclose()
+        raise _error_for(e)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/x-ndjson"), (b"cache-control", b"no-cache")],
+    })
+    event = first
+    try:
+        while True:
+            await send({"type": "http.response.body", "body": json.dumps(event, ensure_ascii=False).encode() + b"\n", "more_body": True})
+            try:
+                event = await anext(events)
+            except StopAsyncIteration:
+                break
+    except Exception as e:
+        error = _error_for(e)
+        event = {"event": "error", "status": error.status, "message": str(error)}
+        await send({"type": "http.response.body", "body": json.dumps(event).encode() + b"\n", "more_body": True})
+    finally:
+        await events.aclose()
+    await send({"type": "http.response.body", "body": b""})
+
+
+class App:
+    def __init__(self, text_service, pronunciation_service, max_body_bytes=MAX_BODY_BYTES):
+        self.text_service = text_service
+        self.pronunciation_service = pronunciation_service
+        self.max_body_bytes = max_body_bytes
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/metrics"): self.metrics,
+            ("POST", "/text-analysis"): self.text_analysis,
+            ("POST", "/pronunciation"): self.pronunciation,
+            ("POST", "/pronunciation/feedback"): self.feedback,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        handler = self.routes.get((scope["method"], scope["path"]))
+        # Client paths are unbounded, so only matched routes are used as metric labels.
+        route = scope["path"] if handler is not None else "unmatched"
+        try:
+            if handler is None:
+                raise HTTPError(404, "Not found.")
+            with METRICS.span("api", route=scope["path"]):
+                await handler(scope, receive, send)
+        except Exception as e:
+            error = _error_for(e)
+            METRICS.inc("api_errors_total", route=route, status=error.status)
+            await send_json(send, error.status, {"error": str(error)}, error.headers)
+
+    async def _json_body(self, receive):
+        try:
+            return json.loads(await read_body(receive, self.max_body_bytes))
+        except ValueError:
+            raise HTTPError(400, "The request body is not valid JSON.")
+
+    async def health(self, scope, receive, send):
+        from speakable.startup import speech_model_ready
+
+        await send_json(send, 200, {
+            "status": "ok",
+            "speech_model_ready": speech_model_ready(),
+            "text_analysis": self.text_service.stats()["requests"],
+            "pronunciation": self.pronunciation_service.stats()["requests"],
+        })
+
+    async def metrics(self, scope, receive, send):
+        body = METRICS.prometheus().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"text/plain; version=0.0.4; charset=utf-8")],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def text_analysis(self, scope, receive, send):
+        request = await self._json_body(receive)
+
+        def analyse(text, model, on_event):
+            data, _, served_by, prompt = self.text_service.analyse(text, model, on_event=on_event)
+            return {"analysis": data, "served_by": served_by, "prompt": prompt}
+
+        await send_events(send, stream_events(
+            self.text_service.limiter, analyse, request["text"], request.get("model", DEFAULT_MODEL)
+        ))
+
+    async def pronunciation(self, scope, receive, send):
+        query = parse_qs(scope.get("query_string", b"").decode("utf-8"))
+        if not query.get("sentence"):
+            raise HTTPError(400, "The sentence query parameter is required.")
+        audio = await read_body(receive, self.max_body_bytes)
+        await send_events(send, stream_events(
+            self.pronunciation_service.limiter, self.pronunciation_service.assess, audio, query["sentence"][0]
+        ))
+
+    async def feedback(self, scope, receive, send):
+        request = await self._json_body(receive)
+        feedback, prompt = await self.pronunciation_service.afeedback(
+            request["result"], request["sentence"], request.get("model", DEFAULT_MODEL)
+        )
+        await send_json(send, 200, {"feedback": feedback, "prompt": prompt})
+
+
+def create_app():
+    from speakable.startup import ensure_nltk_data
+
+    # Text Analysis splits text into sentences with punkt, which a fresh host has to download.
+    ensure_nltk_data()
+    router = router_from_env()
+    return App(
+        TextAnalysisService.from_env(router),
+        PronunciationService.from_env(router),
+        max_body_bytes=int(float(os.getenv("SPEAKABLE_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+    )
@@ -0,0 +1,81 @@
+import functools
+import subprocess
+import time
+from io import BytesIO
+
+import numpy as np
+
+from speakable.inference import SAMPLE_RATE
+
+
+@functools.lru_cache(maxsize=16)
+def get_resampler(orig_freq, new_freq=SAMPLE_RATE):
+    import torchaudio
+
+    # The transform computes its sinc kernel once on construction, so it is kept per source rate.
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+
+
+def _decode_soundfile(data):
+    import soundfile
+
+    samples, sample_rate = soundfile.read(BytesIO(data), dtype="float32", always_2d=True)
+    return samples, sample_rate
+
+
+def _decode_ffmpeg(data):
+    # ffmpeg decodes, downmixes and resamples in one pass and writes raw float32 samples to
+    # its stdout, so there is no intermediate file or encoding.
+    result = subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+        ],
+        input=data,
+        capture_output=True
+    )
+    if result.returncode != 0:
+        raise ValueError(f"ffmpeg could not decode the recording: {result.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype="<f4").reshape(-1, 1), SAMPLE_RATE
+
+
+# Containers libsndfile reads in process, by their leading bytes.
+SOUNDFILE_SIGNATURES = (b"RIFF", b"fLaC", b"OggS", b"FORM")
+
+
+def decode_audio(data, timings=None):
+    # Turns recorder bytes into mono 16 kHz float32 samples. Formats libsndfile understands
+    # (wav, flac, ogg, aiff) are decoded in process; anything else (webm from the browser) goes
+    # straight to ffmpeg, which hands back samples that are already mono and 16 kHz. Per-stage
+    # durations are added to timings when a dict is given.
+    start = time.perf_counter()
+    if data[:4] in SOUNDFILE_SIGNATURES:
+        try:
+            samples, sample_rate = _decode_soundfile(data)
+        except Exception:
+            samples, sample_rate = _decode_ffmpeg(data)
+    else:
+        samples, sample_rate = _decode_ffmpeg(data)
+    decoded = time.perf_counter()
+
+    samples = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    downmixed = time.perf_counter()
+
+    if sample_rate != SAMPLE_RATE:
+        import torch
+
+        with torch.no_grad():
+            samples = get_resampler(sample_rate)(torch.from_numpy(samples)).numpy()
+    resampled = time.perf_counter()
+
+    if timings is not None:
+        timings["decode"] = decoded - start
+        timings["downmix"] = downmixed - decoded
+        timings["resample"] = resampled - downmixed
+    return samples
+
+
+def load_audio(path, timings=None):
+    with open(path, "rb") as f:
+        return decode_audio(f.read(), timings)
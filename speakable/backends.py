@@ -0,0 +1,143 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from speakable.cache import CACHE_DIR
+from speakable.inference import SAMPLE_RATE
+
+BACKENDS = ("fp32", "int8", "torchscript", "onnx")
+EXPORTED = ("torchscript", "onnx")
+
+EXPORT_DIR = os.path.join(CACHE_DIR, "exports")
+
+
+class _LogitsOnly(torch.nn.Module):
+    # Exporters need plain tensors in and out rather than a ModelOutput.
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_values, attention_mask):
+        return self.model(input_values, attention_mask=attention_mask).logits
+
+
+class TorchScriptModel:
+    def __init__(self, module, config):
+        self.module = module
+        self.config = config
+
+    def __call__(self, input_values, attention_mask):
+        return SimpleNamespace(logits=self.module(input_values, attention_mask))
+
+
+class OnnxModel:
+    def __init__(self, session, config):
+        self.session = session
+        self.config = config
+
+    def __call__(self, input_values, attention_mask):
+        logits, = self.session.run(
+            ["logits"],
+            {
+                "input_values": input_values.numpy().astype(np.float32),
+                "attention_mask": attention_mask.numpy().astype(np.int64),
+            }
+        )
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+
+def set_num_threads(num_threads):
+    if num_threads:
+        torch.set_num_threads(int(num_threads))
+
+
+def load_backend(name, model, num_threads=None):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {name!r}, expected one of {', '.join(BACKENDS)}.")
+
+    set_num_threads(num_threads)
+    model.eval()
+
+    if name == "fp32":
+        return model
+
+    if name == "int8":
+        # Quantising in place keeps a single copy of the weights in memory.
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    if name == "torchscript":
+        return TorchScriptModel(export_torchscript(model), model.config)
+
+    return OnnxModel(export_onnx(model, num_threads), model.config)
+
+
+def _example_inputs():
+    input_values = torch.zeros(2, SAMPLE_RATE)
+    attention_mask = torch.ones(2, SAMPLE_RATE, dtype=torch.long)
+    attention_mask[1, SAMPLE_RATE // 2:] = 0
+    return input_values, attention_mask
+
+
+def export_path(model_id, backend):
+    extension = {"torchscript": "pt", "onnx": "onnx"}[backend]
+    return os.path.join(EXPORT_DIR, f"{model_id.replace('/', '--')}.{extension}")
+
+
+def load_export(backend, model_id, config, num_threads=None):
+    # Loads an export written earlier by load_backend without loading the fp32 weights.
+    path = export_path(model_id, backend)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {backend} export of {model_id} in {EXPORT_DIR}.")
+    set_num_threads(num_threads)
+    if backend == "torchscript":
+        return TorchScriptModel(torch.jit.load(path), config)
+    return OnnxModel(_onnx_session(path, num_threads), config)
+
+
+def export_torchscript(model):
+    path = export_path(model.name_or_path, "torchscript")
+    if os.path.exists(path):
+        return torch.jit.load(path)
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    with torch.no_grad():
+        module = torch.jit.trace(_LogitsOnly(model), _example_inputs(), strict=False)
+    module = torch.jit.freeze(module.eval())
+    torch.jit.save(module, path)
+    return module
+
+
+def export_onnx(model, num_threads=None):
+    path = export_path(model.name_or_path, "onnx")
+    if not os.path.exists(path):
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                _LogitsOnly(model),
+                _example_inputs(),
+                path,
+                input_names=["input_values", "attention_mask"],
+                output_names=["logits"],
+                dynamic_axes={
+                    "input_values": {0: "batch", 1: "samples"},
+                    "attention_mask": {0: "batch", 1: "samples"},
+                    "logits": {0: "batch", 1: "frames"},
+                },
+                opset_version=17
+            )
+    return _onnx_session(path, num_threads)
+
+
+def _onnx_session(path, num_threads=None):
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError("The onnx backend needs onnxruntime: pip install onnxruntime") from e
+
+    options = onnxruntime.SessionOptions()
+    if num_threads:
+        options.intra_op_num_threads = int(num_threads)
+    return onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
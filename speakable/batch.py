@@ -0,0 +1,241 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+
+from speakable.inference import SAMPLE_RATE
+
+# Scores a whole corpus of recordings without the UI. Every utterance is an audio file and the
+# text the speaker was reading, taken from WebDataset tar shards (<key>.wav + <key>.txt) or from a
+# directory laid out the same way. Results are written to a JSONL file, one line per utterance,
+# as they complete; running the same command again skips utterances that are already written.
+#
+#   python -m speakable.batch "corpus/shard-{000000..000099}.tar" --output scores.jsonl --processes 4
+
+AUDIO_EXTENSIONS = ("wav", "flac", "mp3", "ogg", "webm", "m4a")
+TEXT_EXTENSIONS = ("txt", "text", "transcript")
+
+_engine = None
+
+
+def _first(sample, extensions):
+    for extension in extensions:
+        if extension in sample:
+            return extension, sample[extension]
+    return None, None
+
+
+def iter_shards(urls):
+    import webdataset as wds
+
+    for sample in wds.WebDataset(urls, shardshuffle=False):
+        _, audio = _first(sample, AUDIO_EXTENSIONS)
+        _, text = _first(sample, TEXT_EXTENSIONS)
+        if isinstance(text, bytes):
+            text = text.decode("utf-8")
+        yield sample["__key__"], audio, text
+
+
+def iter_directory(directory):
+    for root, _, files in sorted(os.walk(directory)):
+        for name in sorted(files):
+            stem, extension = os.path.splitext(name)
+            if extension[1:].lower() not in AUDIO_EXTENSIONS:
+                continue
+            key = os.path.relpath(os.path.join(root, stem), directory)
+            text = None
+            for text_extension in TEXT_EXTENSIONS:
+                text_path = os.path.join(root, f"{stem}.{text_extension}")
+                if os.path.exists(text_path):
+                    with open(text_path, encoding="utf-8") as f:
+                        text = f.read()
+                    break
+            with open(os.path.join(root, name), "rb") as f:
+                yield key, f.read(), text
+
+
+def iter_samples(sources):
+    for source in sources:
+        if os.path.isdir(source):
+            yield from iter_directory(source)
+        else:
+            yield from iter_shards(source)
+
+
+def completed_keys(path):
+    # An interrupted run can leave half a line at the end of the file; it is cut off so that new
+    # results are appended after the last complete one.
+    keys = set()
+    if not os.path.exists(path):
+        return keys
+    good_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                keys.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                break
+            good_bytes += len(line)
+    with open(path, "rb+") as f:
+        f.truncate(good_bytes)
+    return keys
+
+
+def init_worker(num_threads):
+    global _engine
+    if num_threads:
+        os.environ["SPEAKABLE_NUM_THREADS"] = str(num_threads)
+
+    from speakable.startup import load_local_engine
+
+    _engine = load_local_engine()
+
+
+def score_batch(batch):
+    import numpy as np
+
+    from speakable.audio import decode_audio
+    from speakable.gop import score_pronunciation
+    from speakable.vad import detect_speech
+
+    results, ready = [], []
+    for key, audio, text in batch:
+        start = time.perf_counter()
+        try:
+            if audio is None or not text:
+                raise ValueError("Utterance has no audio or no text.")
+            samples = decode_audio(audio)
+            speech = detect_speech(samples, split_pause_ms=0)
+            if speech.segments:
+                (begin, end), = speech.segments
+                samples = samples[begin:end]
+            ready.append(len(results))
+            results.append({"key": key, "text": text.strip(), "samples": samples, "seconds": len(samples) / SAMPLE_RATE})
+        except Exception as e:
+            results.append({"key": key, "error": repr(e)})
+        results[-1]["elapsed"] = time.perf_counter() - start
+    if not ready:
+        return [_finish(result) for result in results]
+
+    # The model and espeak each run once for the whole batch, and so does the alignment.
+    start = time.perf_counter()
+    try:
+        recognitions, references, words, spoken, alignments = _recognize(results, ready)
+    except Exception as e:
+        for i in ready:
+            results[i]["error"] = repr(e)
+        return [_finish(result) for result in results]
+    frame_seconds = np.prod(_engine.model.config.conv_stride) / SAMPLE_RATE
+    shared = (time.perf_counter() - start) / len(ready)
+
+    for i, recognition, reference, utterance_words, spoken_ipa, alignment in zip(
+        ready, recognitions, references, words, spoken, alignments
+    ):
+        result = results[i]
+        result["elapsed"] += shared
+        try:
+            pronunciation = score_pronunciation(
+                recognition.logits, _engine.processor, reference, utterance_words, frame_seconds=frame_seconds
+            )
+        except Exception as e:
+            result["error"] = repr(e)
+            continue
+        result.update({
+            "reference_ipa": reference,
+            "spoken_ipa": spoken_ipa,
+            "alignment_ratio": round(alignment.ratio, 4),
+            "alignment_distance": round(alignment.distance, 3),
+            "score": round(pronunciation.score, 2) if pronunciation is not None else None,
+            "words": [
+                {"word": word.word or word.reference, "score": round(word.score, 2)}
+                for word in pronunciation.words
+            ] if pronunciation is not None else [],
+        })
+    return [_finish(result) for result in results]
+
+
+def _recognize(results, ready):
+    from speakable.alignment import align_batch, written_words
+    from speakable.phonemes import clean_ipa, phonemize_sentences
+
+    recognitions = _engine.forward([results[i]["samples"] for i in ready])
+    references = [clean_ipa(ipa) for ipa in phonemize_sentences([results[i]["text"] for i in ready])]
+    words = [written_words(results[i]["text"]) for i in ready]
+    spoken = [clean_ipa(recognition.text) for recognition in recognitions]
+    alignments = align_batch(list(zip(spoken, references)), words)
+    return recognitions, references, words, spoken, alignments
+
+
+def _finish(result):
+    result.pop("samples", None)
+    result["elapsed"] = round(result["elapsed"], 3)
+    if "seconds" in result:
+        result["seconds"] = round(result["seconds"], 3)
+    return result
+
+
+def batched(samples, batch_size, skip):
+    batch = []
+    for sample in samples:
+        if sample[0] in skip:
+            continue
+        batch.append(sample)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def run(sources, output, processes=2, batch_size=8, num_threads=None):
+    skip = completed_keys(output)
+    context = multiprocessing.get_context("spawn")
+    summary = {"skipped": len(skip), "scored": 0, "errors": 0, "audio_seconds": 0.0}
+    start = time.perf_counter()
+
+    # Batches are handed out a few at a time, so a large corpus is never read into memory at once
+    # and results are written in input order.
+    with context.Pool(processes, initializer=init_worker, initargs=(num_threads,)) as pool, \
+            open(output, "a", encoding="utf-8") as f:
+        pending = deque()
+
+        def write(results):
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+                summary["errors" if "error" in result else "scored"] += 1
+                summary["audio_seconds"] += result.get("seconds", 0.0)
+            f.flush()
+
+        for batch in batched(iter_samples(sources), batch_size, skip):
+            pending.append(pool.apply_async(score_batch, (batch,)))
+            if len(pending) >= 2 * processes:
+                write(pending.popleft().get())
+        while pending:
+            write(pending.popleft().get())
+
+    elapsed = time.perf_counter() - start
+    summary["wall_seconds"] = round(elapsed, 1)
+    summary["utterances_per_second"] = round(summary["scored"] / elapsed, 2) if elapsed else 0.0
+    summary["audio_seconds"] = round(summary["audio_seconds"], 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a corpus of recordings against the text that was read.")
+    parser.add_argument("sources", nargs="+", help="WebDataset shard URLs or patterns, or directories.")
+    parser.add_argument("--output", required=True, help="JSONL file to write; an existing file is resumed.")
+    parser.add_argument("--processes", type=int, default=2, help="Worker processes, each with its own model.")
+    parser.add_argument("--batch-size", type=int, default=8, help="Utterances per model batch.")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads per worker process.")
+    args = parser.parse_args()
+
+    # Shell-style patterns are expanded here; WebDataset brace patterns and URLs are passed on.
+    sources = [path for source in args.sources for path in sorted(glob.glob(source)) or [source]]
+    print(json.dumps(run(sources, args.output, args.processes, args.batch_size, args.threads)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+import numpy as np
+
+from speakable.inference import SAMPLE_RATE
+from speakable.startup import synthetic_speech
+
+# Times every stage of the Pronunciation and Text Analysis pipelines on synthetic audio and text,
+# with a fake chat model standing in for Gemini, so runs are repeatable offline. Results can be
+# saved and later runs compared against them.
+#
+#   python -m speakable.benchmark --output baseline.json
+#   python -m speakable.benchmark --baseline baseline.json --threshold 0.2
+
+STAGES = (
+    "decode_soundfile", "decode_ffmpeg", "resample", "features", "forward", "batch_decode",
+    "phonemize", "align", "prompt", "parse", "analyse",
+)
+RECORDING_RATE = 48000
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven happy children sing about "
+    "bright summer mornings near the quiet river"
+).split()
+
+
+def sentences(count, seconds, seed=0):
+    # Roughly two and a half words per second of speech.
+    rng = random.Random(seed)
+    words = max(3, int(seconds * 2.5))
+    return [" ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "." for _ in range(count)]
+
+
+def recording(seconds):
+    import soundfile as sf
+
+    samples = synthetic_speech(seconds)
+    upsampled = np.interp(
+        np.arange(int(seconds * RECORDING_RATE)) / RECORDING_RATE, np.arange(len(samples)) / SAMPLE_RATE, samples
+    ).astype(np.float32)
+    buffer = BytesIO()
+    sf.write(buffer, upsampled, RECORDING_RATE, format="WAV")
+    return buffer.getvalue(), upsampled
+
+
+def analysis_reply(messages):
+    # A Text Analysis response with one correction per sentence, about the size a real one has.
+    text = messages[-1][1]
+    entries = [
+        {
+            "sentence number": i + 1,
+            "sentence": sentence,
+            "review": sentence,
+            "section": ["Semantic and Logical Coherence"],
+            "subsection": [f"Clarity: Sentence {i + 1} is grammatically correct and reads naturally."],
+        }
+        for i, sentence in enumerate(text.split(". "))
+    ]
+    return repr([{"reviewed_text": text, "explanation": [], "score": 90, "sentences": entries}])
+
+
+def ipa_pairs(count, seconds, seed=0):
+    from speakable.alignment import CONSONANTS, VOWELS
+
+    rng = random.Random(seed)
+    phonemes = sorted(CONSONANTS) + sorted(VOWELS)
+    pairs = []
+    for _ in range(count):
+        words = [[rng.choice(phonemes) for _ in range(rng.randint(2, 5))] for _ in range(max(3, int(seconds * 2.5)))]
+        spoken = [[rng.choice(phonemes) if rng.random() < 0.15 else p for p in word] for word in words]
+        pairs.append((" ".join("".join(word) for word in spoken), " ".join("".join(word) for word in words)))
+    return pairs
+
+
+def prepare(stage, seconds, batch_size):
+    # Returns the function to time, doing all setup (model loading, inputs) up front.
+    if stage in ("decode_soundfile", "decode_ffmpeg"):
+        from speakable.audio import _decode_ffmpeg, _decode_soundfile
+
+        decode = _decode_soundfile if stage == "decode_soundfile" else _decode_ffmpeg
+        data, _ = recording(seconds)
+        return lambda: [decode(data) for _ in range(batch_size)]
+
+    if stage == "resample":
+        import torch
+
+        from speakable.audio import get_resampler
+
+        _, samples = recording(seconds)
+        samples = torch.from_numpy(samples)
+        resampler = get_resampler(RECORDING_RATE)
+
+        def run():
+            with torch.no_grad():
+                return [resampler(samples) for _ in range(batch_size)]
+        return run
+
+    if stage in ("features", "forward", "batch_decode"):
+        import torch
+
+        from speakable.startup import load_model_ipa_model
+
+        processor, model = load_model_ipa_model()
+        waveforms = [synthetic_speech(seconds) for _ in range(batch_size)]
+
+        def features():
+            return processor(
+                waveforms, sampling_rate=SAMPLE_RATE, return_tensors="pt", padding=True, return_attention_mask=True
+            )
+        if stage == "features":
+            return features
+
+        inputs = features()
+
+        def forward():
+            with torch.no_grad():
+                return model(inputs.input_values, attention_mask=inputs.attention_mask).logits
+        if stage == "forward":
+            return forward
+
+        predicted_ids = torch.argmax(forward(), dim=-1)
+        return lambda: processor.batch_decode(predicted_ids)
+
+    if stage == "phonemize":
+        from speakable.phonemes import get_backend
+
+        # The backend is called directly so the reference cache does not hide the cost.
+        backend, lock = get_backend("en-us")
+        texts = sentences(batch_size, seconds)
+
+        def run():
+            with lock:
+                return backend.phonemize(texts, strip=True, njobs=1)
+        return run
+
+    if stage == "align":
+        from speakable.alignment import align_batch
+
+        pairs = ipa_pairs(batch_size, seconds)
+        return lambda: align_batch(pairs)
+
+    from speakable.fake_llm import FakeChatModel
+    from speakable.structured import AnalysisStreamParser
+    from speakable.text_analysis import analyse_text, build_messages
+
+    text = " ".join(sentences(batch_size, seconds))
+    if stage == "prompt":
+        return lambda: build_messages(text)
+    if stage == "parse":
+        reply = analysis_reply(build_messages(text))
+
+        def parse():
+            # Fed the way a streamed reply arrives.
+            parser = AnalysisStreamParser()
+            for start in range(0, len(reply), 40):
+                parser.feed(reply[start:start + 40])
+            return parser.finish()
+        return parse
+    if stage == "analyse":
+        llm = FakeChatModel(respond=analysis_reply)
+        return lambda: analyse_text(llm, "fake", text)
+    raise ValueError(f"Unknown stage {stage!r}.")
+
+
+def measure(stage, seconds, batch_size, repeats):
+    try:
+        run = prepare(stage, seconds, batch_size)
+        run()
+    except ImportError as e:
+        return {"stage": stage, "seconds": seconds, "batch_size": batch_size, "skipped": str(e)}
+
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+
+    # Allocations are traced in a separate, untimed run; tracemalloc sees numpy buffers but not
+    # memory that torch allocates itself.
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies_ms = np.array(latencies) * 1000
+    median = float(np.percentile(latencies_ms, 50))
+    return {
+        "stage": stage,
+        "seconds": seconds,
+        "batch_size": batch_size,
+        "p50_ms": round(median, 3),
+        "p90_ms": round(float(np.percentile(latencies_ms, 90)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "mean_ms": round(float(latencies_ms.mean()), 3),
+        "items_per_second": round(batch_size / (median / 1000), 2) if median else None,
+        "audio_seconds_per_second": round(batch_size * seconds / (median / 1000), 2) if median else None,
+        "peak_traced_mb": round(peak / 2 ** 20, 2),
+    }
+
+
+def benchmark(stages=STAGES, lengths=(1, 4, 12), batch_sizes=(1, 4, 8), repeats=5):
+    results = [
+        measure(stage, seconds, batch_size, repeats)
+        for stage in stages
+        for seconds in lengths
+        for batch_size in batch_sizes
+    ]
+    return {
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "repeats": repeats,
+        # ru_maxrss is reported in kilobytes on Linux.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "results": results,
+    }
+
+
+def _case(result):
+    return result["stage"], result["seconds"], result["batch_size"]
+
+
+def compare(report, baseline, threshold=0.2, min_ms=0.5):
+    # A case regresses when its median is more than threshold slower than the baseline and by at
+    # least min_ms, so that timer noise on sub-millisecond stages is not reported.
+    previous = {_case(result): result for result in baseline["results"] if "p50_ms" in result}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get(_case(result))
+        if before is None or "p50_ms" not in result:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+        if change > threshold and result["p50_ms"] - before["p50_ms"] >= min_ms:
+            regressions.append({
+                "stage": result["stage"],
+                "seconds": result["seconds"],
+                "batch_size": result["batch_size"],
+                "baseline_p50_ms": before["p50_ms"],
+                "p50_ms": result["p50_ms"],
+                "change": round(change, 3),
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the Speakable pipelines.")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--lengths", nargs="+", type=float, default=[1, 4, 12], help="Utterance lengths in seconds.")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per case.")
+    parser.add_argument("--output", help="Write the report to this file, e.g. to use it as the next baseline.")
+    parser.add_argument("--baseline", help="Report to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown of the median, as a fraction.")
+    args = parser.parse_args()
+
+    report = benchmark(args.stages, args.lengths, args.batch_sizes, args.repeats)
+
+    print(f"{'stage':<18} {'len s':>6} {'batch':>6} {'p50 ms':>10} {'p90 ms':>10} {'items/s':>10} {'MB':>8}")
+    for row in report["results"]:
+        if "skipped" in row:
+            print(f"{row['stage']:<18} {row['seconds']:>6} {row['batch_size']:>6}  skipped: {row['skipped']}")
+            continue
+        print(
+            f"{row['stage']:<18} {row['seconds']:>6} {row['batch_size']:>6} {row['p50_ms']:>10} "
+            f"{row['p90_ms']:>10} {row['items_per_second']:>10} {row['peak_traced_mb']:>8}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression['stage']} ({regression['seconds']} s, batch {regression['batch_size']}): "
+                f"{regression['baseline_p50_ms']} ms -> {regression['p50_ms']} ms ({regression['change']:+.0%})"
+            )
+        if regressions:
+            sys.exit(1)
+        print(f"No stage is more than {args.threshold:.0%} slower than {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
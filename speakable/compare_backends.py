@@ -0,0 +1,151 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import resource
+import statistics
+import time
+
+import Levenshtein
+
+from speakable.backends import BACKENDS, EXPORTED
+
+# Compares inference backends on the same recordings. Every backend runs in a fresh process so
+# that its load time and memory are measured on their own. Exported backends are exported from
+# the fp32 weights in a process of their own first, so the measured process only loads the export.
+#
+#   python -m speakable.compare_backends recording1.wav recording2.wav --backends fp32 int8 onnx
+
+
+def export_backend(backend, num_threads):
+    from transformers import Wav2Vec2ForCTC
+
+    from speakable.backends import load_backend
+    from speakable.inference import MODEL_ID
+
+    load_backend(backend, Wav2Vec2ForCTC.from_pretrained(MODEL_ID), num_threads)
+
+
+def run_backend(backend, paths, num_threads, repeats):
+    from transformers import AutoConfig, Wav2Vec2ForCTC, Wav2Vec2Processor
+
+    from speakable.audio import load_audio
+    from speakable.backends import load_backend, load_export
+    from speakable.inference import MODEL_ID, BatchingEngine
+
+    start = time.perf_counter()
+    processor = Wav2Vec2Processor.from_pretrained(MODEL_ID)
+    if backend in EXPORTED:
+        model = load_export(backend, MODEL_ID, AutoConfig.from_pretrained(MODEL_ID), num_threads)
+    else:
+        model = load_backend(backend, Wav2Vec2ForCTC.from_pretrained(MODEL_ID), num_threads)
+    engine = BatchingEngine(processor, model, max_batch_size=1, max_wait_ms=0)
+    load_seconds = time.perf_counter() - start
+
+    # The process holds only the backend's own model: the fp32 weights for fp32, the same model
+    # quantised in place for int8 (the replaced fp32 layers are freed here), and just the export
+    # for the exported backends.
+    gc.collect()
+    rss_mb = resident_mb()
+
+    waveforms = [load_audio(path) for path in paths]
+    engine.forward(waveforms[:1])
+
+    transcripts, latencies = [], []
+    for waveform in waveforms:
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            text, _ = engine.forward([waveform])[0]
+            timings.append(time.perf_counter() - start)
+        transcripts.append(text)
+        latencies.append(statistics.median(timings))
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "latencies": latencies,
+        "transcripts": transcripts,
+        "rss_mb": rss_mb,
+    }
+
+
+def resident_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1024 / 1024
+    except OSError:
+        # Elsewhere only the peak is available; ru_maxrss is in bytes on macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / 1024
+
+
+def phoneme_error_rate(hypothesis, reference):
+    # The decoder separates phonemes with spaces, so multi-character phonemes such as tʃ or aɪ
+    # count as one. Each distinct phoneme is mapped to a single character for Levenshtein.
+    hypothesis, reference = hypothesis.split(), reference.split()
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    symbols = {phoneme: chr(0xE000 + i) for i, phoneme in enumerate(dict.fromkeys(hypothesis + reference))}
+    return Levenshtein.distance(
+        "".join(symbols[p] for p in hypothesis), "".join(symbols[p] for p in reference)
+    ) / len(reference)
+
+
+def compare(paths, backends, num_threads=None, repeats=3):
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for backend in dict.fromkeys(["fp32", *backends]):
+        if backend in EXPORTED:
+            with context.Pool(1) as pool:
+                pool.apply(export_backend, (backend, num_threads))
+        with context.Pool(1) as pool:
+            results[backend] = pool.apply(run_backend, (backend, paths, num_threads, repeats))
+
+    baseline = results["fp32"]["transcripts"]
+    report = []
+    for backend, result in results.items():
+        errors = [
+            phoneme_error_rate(hypothesis, reference)
+            for hypothesis, reference in zip(result["transcripts"], baseline)
+        ]
+        report.append({
+            "backend": backend,
+            "load_seconds": round(result["load_seconds"], 2),
+            "median_latency_ms": round(statistics.median(result["latencies"]) * 1000, 1),
+            "max_latency_ms": round(max(result["latencies"]) * 1000, 1),
+            "rss_mb": round(result["rss_mb"], 1),
+            "per_vs_fp32": round(statistics.mean(errors), 4),
+            "utterances": [
+                {"path": path, "latency_ms": round(latency * 1000, 1), "per_vs_fp32": round(error, 4)}
+                for path, latency, error in zip(paths, result["latencies"], errors)
+            ],
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare speech model inference backends against fp32.")
+    parser.add_argument("paths", nargs="+", help="Audio files to recognise.")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--threads", type=int, default=None, help="Threads per backend.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per utterance.")
+    parser.add_argument("--json", dest="json_path", help="Also write the full report to this file.")
+    args = parser.parse_args()
+
+    report = compare(args.paths, args.backends, args.threads, args.repeats)
+
+    print(f"{'backend':<12} {'load s':>8} {'p50 ms':>9} {'max ms':>9} {'rss MB':>9} {'PER':>8}")
+    for row in report:
+        print(
+            f"{row['backend']:<12} {row['load_seconds']:>8} {row['median_latency_ms']:>9} "
+            f"{row['max_latency_ms']:>9} {row['rss_mb']:>9} {row['per_vs_fp32']:>8}"
+        )
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+from dotenv import load_dotenv
+
+# Loads .env into the environment. Several speakable modules read their settings at import
+# (speakable.metrics, speakable.cache), so every entry point imports this module before any
+# other speakable module.
+load_dotenv()
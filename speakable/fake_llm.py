@@ -0,0 +1,94 @@
+import asyncio
+import random
+import time
+from types import SimpleNamespace
+
+
+def quota_error(model):
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+    except ImportError:
+        error = RuntimeError(f"429 Resource has been exhausted for {model}.")
+        error.code = 429
+        return error
+    return ResourceExhausted(f"Resource has been exhausted for {model}.")
+
+
+def echo_analysis(messages):
+    # A well-formed Text Analysis response that leaves the text unchanged.
+    text = messages[-1][1]
+    return repr([{"reviewed_text": text, "explanation": [], "score": 100, "sentences": []}])
+
+
+class FakeChatModel:
+    # Stands in for a chat model offline. respond builds the reply content from the messages,
+    # latency (seconds, or a (low, high) range) is slept before replying, and quota errors are
+    # raised for the first fail_first calls and then with probability quota_error_rate. Streamed
+    # replies come in pieces of chunk_chars characters, chunk_latency seconds apart.
+
+    def __init__(
+        self,
+        model="fake",
+        respond=echo_analysis,
+        latency=0.0,
+        quota_error_rate=0.0,
+        fail_first=0,
+        seed=None,
+        chunk_chars=40,
+        chunk_latency=0.0
+    ):
+        self.model = model
+        self.respond = respond
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.chunk_latency = chunk_latency
+        self.quota_error_rate = quota_error_rate
+        self.fail_first = fail_first
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        if isinstance(self.latency, tuple):
+            return self._random.uniform(*self.latency)
+        return self.latency
+
+    def _reply(self, messages):
+        self.calls += 1
+        if self.calls <= self.fail_first or self._random.random() < self.quota_error_rate:
+            raise quota_error(self.model)
+        return SimpleNamespace(content=self.respond(messages), response_metadata={"model_name": self.model})
+
+    def invoke(self, messages, **kwargs):
+        time.sleep(self._delay())
+        return self._reply(messages)
+
+    async def ainvoke(self, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        return self._reply(messages)
+
+    def _chunks(self, reply):
+        content = reply.content
+        for start in range(0, len(content), self.chunk_chars):
+            yield SimpleNamespace(content=content[start:start + self.chunk_chars], response_metadata=reply.response_metadata)
+
+    def stream(self, messages, **kwargs):
+        time.sleep(self._delay())
+        for chunk in self._chunks(self._reply(messages)):
+            yield chunk
+            time.sleep(self.chunk_latency)
+
+    async def astream(self, messages, **kwargs):
+        await asyncio.sleep(self._delay())
+        for chunk in self._chunks(self._reply(messages)):
+            yield chunk
+            await asyncio.sleep(self.chunk_latency)
+
+
+def fake_factory(overrides=None, **defaults):
+    # A ModelRouter factory that gives every model its own FakeChatModel built from defaults,
+    # with per-model options taken from overrides, e.g. {"gemini-1.5-flash": {"fail_first": 3}}.
+    overrides = overrides or {}
+
+    def factory(model):
+        return FakeChatModel(model=model, **{**defaults, **overrides.get(model, {})})
+    return factory
@@ -0,0 +1,195 @@
+import asyncio
+import time
+
+from speakable.metrics import METRICS
+from speakable.structured import PartialAnalysis, validate_analysis
+from speakable.text_analysis import aanalyse_text, analyse_text, match_entries
+
+MAX_CHUNK_CHARS = 2000
+
+
+def chunk_indices(sentences, indices, max_chars=MAX_CHUNK_CHARS):
+    # Groups sentence indices into chunks of at most max_chars characters without splitting a
+    # sentence. A single sentence longer than max_chars gets a chunk of its own.
+    chunks, chunk, size = [], [], 0
+    for index in indices:
+        length = len(sentences[index]) + 1
+        if chunk and size + length > max_chars:
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(index)
+        size += length
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def surrounding_context(sentences, indices, size):
+    selected = set(indices)
+    context = sorted({
+        i
+        for j in indices
+        for i in range(max(0, j - size), min(len(sentences), j + size + 1))
+        if i not in selected
+    })
+    return " ... ".join(sentences[i] for i in context)
+
+
+class RateLimiter:
+    # Spaces request starts at least 60 / requests_per_minute seconds apart.
+
+    def __init__(self, requests_per_minute=0):
+        self.interval = 60 / requests_per_minute if requests_per_minute else 0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            delay = self._next - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, time.monotonic()) + self.interval
+
+
+def merge_chunks(sentences, indices, chunks, results):
+    # Combines per-chunk analyses into one, numbering sentences by their position in indices and
+    # weighting each chunk's score by the number of sentences it covered.
+    positions = {index: position for position, index in enumerate(indices)}
+    entries, explanation, reviewed = [], [], []
+    weighted_score = 0.0
+    for chunk, data in zip(chunks, results):
+        matched = match_entries(data.get("sentences", []), [sentences[i] for i in chunk])
+        for local, entry in sorted(matched.items()):
+            entries.append({**entry, "sentence number": str(positions[chunk[local]] + 1)})
+        for item in data.get("explanation", []):
+            if item not in explanation:
+                explanation.append(item)
+        reviewed.append(data.get("reviewed_text") or " ".join(sentences[i] for i in chunk))
+        weighted_score += float(data.get("score", 0)) * len(chunk)
+
+    return {
+        "reviewed_text": " ".join(reviewed),
+        "explanation": explanation,
+        "score": round(weighted_score / len(indices)) if indices else 0,
+        "sentences": entries,
+    }
+
+
+def merge_repair(sentences, chunk, partial, rest):
+    # Completes a PartialAnalysis of sentences[chunk] with rest, the analysis of the sentences it
+    # did not cover. The partial's summary already spoke for the whole chunk.
+    if not partial.covered:
+        return rest
+    remaining = chunk[partial.covered:]
+    entries = []
+    kept = match_entries(partial.data["sentences"], [sentences[i] for i in chunk])
+    for local, entry in sorted(kept.items()):
+        if local < partial.covered:
+            entries.append({**entry, "sentence number": str(local + 1)})
+    redone = match_entries(rest.get("sentences", []), [sentences[i] for i in remaining])
+    for local, entry in sorted(redone.items()):
+        entries.append({**entry, "sentence number": str(partial.covered + local + 1)})
+
+    explanation = list(partial.data["explanation"])
+    explanation += [item for item in rest.get("explanation", []) if item not in explanation]
+    return validate_analysis({**partial.data, "explanation": explanation, "sentences": entries})
+
+
+def _chunk_request(sentences, chunk, context_size):
+    return " ".join(sentences[i] for i in chunk), surrounding_context(sentences, chunk, context_size)
+
+
+def _entry_callback(on_entry, sentences, chunk):
+    # Turns the model's entries for sentences[chunk] into on_entry(index, entry) calls, where
+    # index is the position of the corrected sentence in sentences.
+    if on_entry is None:
+        return None
+    excerpt = [sentences[i] for i in chunk]
+
+    def emit(entry):
+        for local, matched in match_entries([entry], excerpt).items():
+            on_entry(chunk[local], matched)
+    return emit
+
+
+def _repair_request(partial, chunk):
+    # Only the sentences after the last complete correction are asked for again, once.
+    METRICS.inc("analysis_repairs_total")
+    return chunk[partial.covered:]
+
+
+def analyse_chunk(llm, model, sentences, chunk, cache=None, context_size=1, on_entry=None, text=None):
+    # text, when given, is sent as written in place of sentences[chunk] with their context.
+    text, context = (text, None) if text is not None else _chunk_request(sentences, chunk, context_size)
+    try:
+        return analyse_text(llm, model, text, cache, context, _entry_callback(on_entry, sentences, chunk))
+    except PartialAnalysis as partial:
+        remaining, rest = _repair_request(partial, chunk), {}
+        if remaining:
+            text, context = _chunk_request(sentences, remaining, context_size)
+            rest = analyse_text(llm, model, text, cache, context, _entry_callback(on_entry, sentences, remaining))
+        return merge_repair(sentences, chunk, partial, rest)
+
+
+async def aanalyse_chunk(llm, model, sentences, chunk, cache=None, context_size=1, on_entry=None):
+    text, context = _chunk_request(sentences, chunk, context_size)
+    try:
+        return await aanalyse_text(llm, model, text, cache, context, _entry_callback(on_entry, sentences, chunk))
+    except PartialAnalysis as partial:
+        remaining, rest = _repair_request(partial, chunk), {}
+        if remaining:
+            text, context = _chunk_request(sentences, remaining, context_size)
+            rest = await aanalyse_text(llm, model, text, cache, context, _entry_callback(on_entry, sentences, remaining))
+        return merge_repair(sentences, chunk, partial, rest)
+
+
+async def analyse_chunks(
+    llm,
+    model,
+    sentences,
+    chunks,
+    cache=None,
+    context_size=1,
+    max_concurrency=4,
+    requests_per_minute=0,
+    on_entry=None
+):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limiter = RateLimiter(requests_per_minute)
+
+    async def run(chunk):
+        async with semaphore:
+            await limiter.wait()
+            return await aanalyse_chunk(llm, model, sentences, chunk, cache, context_size, on_entry)
+
+    return await asyncio.gather(*(run(chunk) for chunk in chunks))
+
+
+def analyse_sentences(
+    llm,
+    model,
+    sentences,
+    indices,
+    cache=None,
+    context_size=1,
+    max_chars=MAX_CHUNK_CHARS,
+    max_concurrency=4,
+    requests_per_minute=0,
+    text=None,
+    on_entry=None
+):
+    # Reviews sentences[indices], with the other sentences as context. Short selections go out as
+    # a single request; longer ones are split into sentence-aligned chunks analysed concurrently.
+    # When every sentence is selected and fits in one request, text is sent as it was written.
+    # on_entry(index, entry) is called with each correction as soon as the model has written it.
+    chunks = chunk_indices(sentences, indices, max_chars)
+    if len(chunks) <= 1:
+        whole = text if text is not None and len(indices) == len(sentences) else None
+        return analyse_chunk(llm, model, sentences, indices, cache, context_size, on_entry, text=whole)
+
+    results = asyncio.run(analyse_chunks(
+        llm, model, sentences, chunks, cache, context_size, max_concurrency, requests_per_minute, on_entry
+    ))
+    return merge_chunks(sentences, indices, chunks, results)
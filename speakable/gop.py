@@ -0,0 +1,91 @@
+import bisect
+import math
+from collections import namedtuple
+
+import numpy as np
+
+from speakable.alignment import split_words
+from speakable.inference import SAMPLE_RATE
+
+PhonemeScore = namedtuple("PhonemeScore", ["phoneme", "word", "start", "end", "gop", "score"])
+WordScore = namedtuple("WordScore", ["index", "word", "reference", "start", "end", "score"])
+PronunciationScore = namedtuple("PronunciationScore", ["score", "words", "phonemes"])
+
+
+def _token_ids(vocab, token):
+    # Phonemes missing from the model vocabulary are looked up without their length mark and
+    # then symbol by symbol; anything still unknown is left out of the alignment.
+    for candidate in (token, token.replace("ː", "")):
+        if candidate in vocab:
+            return [vocab[candidate]]
+    return [vocab[char] for char in token if char in vocab]
+
+
+def _frame_times(segments, frame_seconds):
+    # segments holds (first frame, start in seconds) for each stretch of audio whose logits were
+    # concatenated, so silence that was cut away between them still counts towards timestamps.
+    segments = segments or [(0, 0.0)]
+    first_frames = [first for first, _ in segments]
+
+    def time_of(frame):
+        first, offset = segments[max(0, bisect.bisect_right(first_frames, frame) - 1)]
+        return offset + (frame - first) * frame_seconds
+    return time_of
+
+
+def score_pronunciation(logits, processor, reference_ipa, words=None, frame_seconds=None, segments=None):
+    # Goodness of pronunciation from the CTC posteriors: the reference phonemes are force-aligned
+    # to the frames, and each phoneme scores the mean log ratio between its own posterior and the
+    # best competing phoneme over its frames, mapped to 0-100 with exp.
+    import torch
+    import torchaudio.functional as F
+
+    vocab = processor.tokenizer.get_vocab()
+    blank = processor.tokenizer.pad_token_id
+    frame_seconds = frame_seconds or 320 / SAMPLE_RATE
+    time_of = _frame_times(segments, frame_seconds)
+
+    targets, owners = [], []
+    reference_words = split_words(reference_ipa)
+    for word_index, tokens in enumerate(reference_words):
+        for token in tokens:
+            for token_id in _token_ids(vocab, token):
+                targets.append(token_id)
+                owners.append((word_index, token))
+
+    log_probs = torch.log_softmax(logits.float(), dim=-1)
+    repeats = sum(a == b for a, b in zip(targets, targets[1:]))
+    if not targets or len(log_probs) < len(targets) + repeats:
+        return None
+
+    alignment, _ = F.forced_align(log_probs[None], torch.tensor([targets], dtype=torch.int32), blank=blank)
+    spans = F.merge_tokens(alignment[0], torch.zeros(len(log_probs)), blank=blank)
+
+    competitors = log_probs.clone()
+    competitors[:, blank] = -math.inf
+
+    phonemes = []
+    for span, token_id, (word_index, token) in zip(spans, targets, owners):
+        frames = log_probs[span.start:span.end, token_id]
+        others = competitors[span.start:span.end].clone()
+        others[:, token_id] = -math.inf
+        ratio = frames - torch.maximum(others.max(dim=-1).values, frames)
+        gop = float(ratio.mean())
+        phonemes.append(PhonemeScore(
+            token, word_index, time_of(span.start), time_of(span.end - 1) + frame_seconds, gop, 100 * math.exp(gop)
+        ))
+
+    if words is None or len(words) != len(reference_words):
+        words = [None] * len(reference_words)
+
+    word_scores = []
+    for word_index, (word, tokens) in enumerate(zip(words, reference_words)):
+        own = [phoneme for phoneme in phonemes if phoneme.word == word_index]
+        if not own:
+            continue
+        word_scores.append(WordScore(
+            word_index, word, "".join(tokens), own[0].start, own[-1].end, float(np.mean([p.score for p in own]))
+        ))
+
+    overall = float(np.mean([p.score for p in phonemes])) if phonemes else 0.0
+    return PronunciationScore(overall, word_scores, phonemes)
@@ -0,0 +1,83 @@
+from difflib import SequenceMatcher
+
+from nltk.tokenize import sent_tokenize
+
+from speakable.fanout import analyse_sentences
+from speakable.text_analysis import match_entries
+
+# Text Analysis state is kept per sentence so that an edit only sends the sentences that
+# changed. Each sentence record holds its latest review, its entry from the model's
+# "sentences" list (None when no correction was needed), the score of the request that reviewed
+# it and the id of that request, whose explanation list is kept while any of its sentences is
+# still in the text.
+
+
+def merge_analysis(records, groups, reviewed_text=None):
+    entries = []
+    for i, record in enumerate(records):
+        if record["entry"] is not None:
+            entries.append({**record["entry"], "sentence number": str(i + 1), "sentence": record["sentence"]})
+
+    explanation = []
+    for group in dict.fromkeys(record["group"] for record in records):
+        for item in groups[group]["explanation"]:
+            if item not in explanation:
+                explanation.append(item)
+
+    scores = [record["score"] for record in records]
+    return {
+        "reviewed_text": reviewed_text or " ".join(record["review"] for record in records),
+        "explanation": explanation,
+        "score": round(sum(scores) / len(scores)) if scores else 0,
+        "sentences": entries,
+    }
+
+
+def analyse_incrementally(llm, model, text, previous=None, cache=None, max_changed_ratio=0.6, **options):
+    # options are passed on to speakable.fanout.analyse_sentences.
+    sentences = sent_tokenize(text)
+    records = [None] * len(sentences)
+    groups = {}
+
+    if previous is not None and previous["model"] == model:
+        old_sentences = [record["sentence"] for record in previous["records"]]
+        matcher = SequenceMatcher(a=old_sentences, b=sentences, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                records[j1:j2] = previous["records"][i1:i2]
+        groups = {record["group"]: previous["groups"][record["group"]] for record in records if record is not None}
+
+    changed = [i for i, record in enumerate(records) if record is None]
+    if not changed and previous is not None:
+        return merge_analysis(records, groups, previous.get("reviewed_text")), previous
+
+    # Large edits are cheaper to send whole than to describe with context.
+    full = len(changed) > max_changed_ratio * len(sentences)
+    if full:
+        changed = list(range(len(sentences)))
+    data = analyse_sentences(llm, model, sentences, changed, cache, text=text, **options)
+
+    group = previous["next_group"] if previous is not None else 0
+    groups[group] = {"explanation": list(data.get("explanation", []))}
+
+    excerpt_sentences = [sentences[i] for i in changed]
+    entries = match_entries(data.get("sentences", []), excerpt_sentences)
+    for local, index in enumerate(changed):
+        entry = entries.get(local)
+        records[index] = {
+            "sentence": sentences[index],
+            "review": entry.get("review", sentences[index]) if entry else sentences[index],
+            "entry": entry,
+            "score": float(data.get("score", 0)),
+            "group": group,
+        }
+
+    reviewed_text = data.get("reviewed_text") if full else None
+    state = {
+        "model": model,
+        "records": records,
+        "groups": groups,
+        "next_group": group + 1,
+        "reviewed_text": reviewed_text,
+    }
+    return merge_analysis(records, groups, reviewed_text), state
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import Counter, deque, namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+MODEL_ID = "facebook/wav2vec2-lv-60-espeak-cv-ft"
+SAMPLE_RATE = 16000
+
+Recognition = namedtuple("Recognition", ["text", "logits"])
+
+
+class BatchingEngine:
+    # Collects utterances from every session and runs them through the model in padded
+    # batches, flushing once max_batch_size utterances are pending or the oldest one has
+    # waited max_wait_ms, whichever comes first.
+
+    def __init__(self, processor, model, max_batch_size=8, max_wait_ms=50):
+        self.processor = processor
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._max_queue_depth = 0
+        self._utterances = 0
+        self._busy_seconds = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="speakable-inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, waveform):
+        future = Future()
+        with self._condition:
+            self._pending.append((np.asarray(waveform, dtype=np.float32), future, time.monotonic()))
+            self._max_queue_depth = max(self._max_queue_depth, len(self._pending))
+            self._condition.notify()
+        return future
+
+    def recognize(self, waveform, timeout=None):
+        return self.submit(waveform).result(timeout)
+
+    def stats(self):
+        with self._condition:
+            queue_depth = len(self._pending)
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "queue_depth": queue_depth,
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "utterances": self._utterances,
+                "mean_batch_size": self._utterances / batches if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "busy_seconds": round(self._busy_seconds, 3),
+            }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                # Counted from when the oldest recording was queued, which may have been during the
+                # previous forward pass.
+                deadline = self._pending[0][2] + self.max_wait
+                while len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                size = min(len(self._pending), self.max_batch_size)
+                batch = [self._pending.popleft() for _ in range(size)]
+
+            self._process(batch)
+
+    def _process(self, batch):
+        start = time.perf_counter()
+        batch = [(waveform, future) for waveform, future, _ in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        waveforms = [waveform for waveform, _ in batch]
+        futures = [future for _, future in batch]
+
+        try:
+            results = self.forward(waveforms)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+        with self._stats_lock:
+            self._batch_sizes[len(waveforms)] += 1
+            self._utterances += len(waveforms)
+            self._busy_seconds += time.perf_counter() - start
+
+    def forward(self, waveforms):
+        import torch
+
+        inputs = self.processor(
+            waveforms,
+            sampling_rate=SAMPLE_RATE,
+            return_tensors="pt",
+            padding=True,
+            return_attention_mask=True
+        )
+        with torch.no_grad():
+            logits = self.model(inputs.input_values, attention_mask=inputs.attention_mask).logits
+
+        # Padded frames still produce logits, so cut every utterance back to its own length
+        # before decoding to keep the padding from leaking phonemes into short recordings.
+        lengths = output_lengths(self.model.config, inputs.attention_mask.sum(-1).tolist())
+        results = []
+        for utterance_logits, length in zip(logits, lengths):
+            utterance_logits = utterance_logits[:length]
+            predicted_ids = torch.argmax(utterance_logits, dim=-1)
+            text = self.processor.decode(predicted_ids)
+            results.append(Recognition(text, utterance_logits))
+        return results
+
+
+def output_lengths(config, input_lengths):
+    lengths = []
+    for length in input_lengths:
+        for kernel, stride in zip(config.conv_kernel, config.conv_stride):
+            length = (length - kernel) // stride + 1
+        lengths.append(max(length, 0))
+    return lengths
@@ -0,0 +1,365 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from speakable.metrics import METRICS
+from speakable.prompts import prompt_size, prompt_usage
+
+MODELS = {
+    "Gemini 1.5 Pro": "gemini-1.5-pro",
+    "Gemini 1.5 Flash": "gemini-1.5-flash",
+    "Gemini 1.5 Flash-8B": "gemini-1.5-flash-8b",
+    "Gemini 2.0 Flash": "gemini-2.0-flash",
+    "Gemini 2.0 Flash-Lite": "gemini-2.0-flash-lite"
+}
+
+DEFAULT_MODEL = "gemini-1.5-flash"
+
+
+class ModelsExhausted(Exception):
+    pass
+
+
+def is_quota_error(error):
+    try:
+        from google.api_core.exceptions import ResourceExhausted
+    except ImportError:
+        ResourceExhausted = ()
+    return isinstance(error, ResourceExhausted) or getattr(error, "code", None) == 429
+
+
+def google_chat_model(model):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    # The router moves on to the next model instead of backing off on the same one.
+    return ChatGoogleGenerativeAI(model=model, max_retries=1)
+
+
+class TokenBucket:
+    # A requests_per_minute of 0 means no limit, as for SPEAKABLE_LLM_RPM.
+
+    def __init__(self, requests_per_minute, burst=None):
+        if requests_per_minute < 0:
+            raise ValueError(f"requests_per_minute must be 0 (no limit) or more, got {requests_per_minute}.")
+        self.unlimited = not requests_per_minute
+        self.rate = requests_per_minute / 60
+        self.capacity = burst or max(1, requests_per_minute / 4)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        if self.unlimited:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def wait_time(self):
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class CircuitBreaker:
+    # Closed until a quota error opens it. After cooldown seconds it lets a single trial request
+    # through (half open); the trial closes it again on success or re-opens it on another quota
+    # error.
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, cooldown=60):
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened >= self.cooldown:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._trial_running = False
+
+    def record_quota_error(self):
+        with self._lock:
+            self.state = self.OPEN
+            self.opened = time.monotonic()
+            self._trial_running = False
+
+    def release(self):
+        # A trial that failed for a reason unrelated to quota does not count either way.
+        with self._lock:
+            self._trial_running = False
+
+
+class ModelRouter:
+    # Serves chat requests from an ordered pool of models. The requested model is tried first and
+    # the rest of the pool in table order after it; models whose circuit is open or whose rate
+    # limit is used up are skipped, and a quota error moves the request on to the next model.
+
+    def __init__(self, models=MODELS.values(), factory=google_chat_model, requests_per_minute=15, cooldown=60, max_wait=30):
+        self.models = list(models)
+        self.factory = factory
+        self.requests_per_minute = requests_per_minute
+        self.cooldown = cooldown
+        self.max_wait = max_wait
+        self.buckets = {model: TokenBucket(requests_per_minute) for model in self.models}
+        self.breakers = {model: CircuitBreaker(cooldown) for model in self.models}
+        self.served = Counter()
+        self.quota_errors = Counter()
+        self.fallbacks = 0
+
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, model):
+        return RoutedChatModel(self, model)
+
+    def chat_model(self, model):
+        with self._lock:
+            if model not in self._clients:
+                self._clients[model] = self.factory(model)
+            return self._clients[model]
+
+    def order(self, preferred):
+        return [preferred] + [model for model in self.models if model != preferred]
+
+    def known_models(self):
+        return list(dict.fromkeys([*self.models, *self.breakers]))
+
+    def _next_model(self, candidates):
+        # Returns the first candidate with a closed (or trial) circuit and a free token, or the
+        # time to wait before one of the healthy candidates has a token again.
+        waits = []
+        for model in candidates:
+            breaker = self.breakers.setdefault(model, CircuitBreaker(self.cooldown))
+            if not breaker.allow():
+                continue
+            bucket = self.buckets.setdefault(model, TokenBucket(self.requests_per_minute))
+            if bucket.try_acquire():
+                return model, 0.0
+            breaker.release()
+            waits.append(bucket.wait_time())
+        return None, min(waits) if waits else None
+
+    def _schedule(self, preferred, tried):
+        candidates = [model for model in self.order(preferred) if model not in tried]
+        model, wait = self._next_model(candidates)
+        if model is None and wait is None:
+            METRICS.inc("models_exhausted_total")
+            raise ModelsExhausted("Every model is currently exhausted.")
+        return model, wait
+
+    def _record(self, model, preferred, error=None):
+        breaker = self.breakers[model]
+        if error is None:
+            breaker.record_success()
+            with self._lock:
+                self.served[model] += 1
+                if model != preferred:
+                    self.fallbacks += 1
+        elif is_quota_error(error):
+            breaker.record_quota_error()
+            METRICS.inc("quota_errors_total", model=model)
+            with self._lock:
+                self.quota_errors[model] += 1
+        else:
+            breaker.release()
+
+    def invoke(self, messages, preferred, served_by=None, **kwargs):
+        tried, deadline = set(), time.monotonic() + self.max_wait
+        while True:
+            model, wait = self._schedule(preferred, tried)
+            if model is None:
+                if time.monotonic() + wait > deadline:
+                    METRICS.inc("models_exhausted_total")
+                    raise ModelsExhausted("Every model is currently rate limited.")
+                time.sleep(wait)
+                continue
+
+            tried.add(model)
+            try:
+                with METRICS.span("llm_invoke", model=model):
+                    response = self.chat_model(model).invoke(messages, **kwargs)
+            except Exception as e:
+                self._record(model, preferred, e)
+                if not is_quota_error(e):
+                    raise
+                continue
+            self._record(model, preferred)
+            METRICS.record_llm(model, messages, response)
+            if served_by is not None:
+                served_by.append(model)
+            return response
+
+    async def ainvoke(self, messages, preferred, served_by=None, **kwargs):
+        tried, deadline = set(), time.monotonic() + self.max_wait
+        while True:
+            model, wait = self._schedule(preferred, tried)
+            if model is None:
+                if time.monotonic() + wait > deadline:
+                    METRICS.inc("models_exhausted_total")
+                    raise ModelsExhausted("Every model is currently rate limited.")
+                await asyncio.sleep(wait)
+                continue
+
+            tried.add(model)
+            try:
+                with METRICS.span("llm_invoke", model=model):
+                    response = await self.chat_model(model).ainvoke(messages, **kwargs)
+            except Exception as e:
+                self._record(model, preferred, e)
+                if not is_quota_error(e):
+                    raise
+                continue
+            self._record(model, preferred)
+            METRICS.record_llm(model, messages, response)
+            if served_by is not None:
+                served_by.append(model)
+            return response
+
+    def _streamed(self, model, preferred, messages, chunks, start, served_by):
+        self._record(model, preferred)
+        METRICS.observe("stage_seconds", time.perf_counter() - start, stage="llm_stream", model=model)
+        usage = next((chunk.usage_metadata for chunk in reversed(chunks) if getattr(chunk, "usage_metadata", None)), None)
+        content = "".join(chunk.content for chunk in chunks)
+        METRICS.record_llm(model, messages, SimpleNamespace(content=content, usage_metadata=usage))
+        if served_by is not None:
+            served_by.append(model)
+
+    def _abandoned(self, model):
+        # The consumer stopped reading (GeneratorExit, cancellation, or a UI rerun raised from its
+        # callback). That says nothing about the model, but a half-open trial must be handed back.
+        self.breakers[model].release()
+
+    def _first_chunk(self, model, start):
+        METRICS.observe("stage_seconds", time.perf_counter() - start, stage="llm_first_chunk", model=model)
+
+    def stream(self, messages, preferred, served_by=None, **kwargs):
+        # Yields the reply chunk by chunk. A quota error only moves the request on to the next
+        # model before the first chunk; after that, switching would mix two different replies.
+        tried, deadline = set(), time.monotonic() + self.max_wait
+        while True:
+            model, wait = self._schedule(preferred, tried)
+            if model is None:
+                if time.monotonic() + wait > deadline:
+                    METRICS.inc("models_exhausted_total")
+                    raise ModelsExhausted("Every model is currently rate limited.")
+                time.sleep(wait)
+                continue
+
+            tried.add(model)
+            chunks, start = [], time.perf_counter()
+            try:
+                for chunk in self.chat_model(model).stream(messages, **kwargs):
+                    if not chunks:
+                        self._first_chunk(model, start)
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                self._record(model, preferred, e)
+                if chunks or not is_quota_error(e):
+                    raise
+                continue
+            except BaseException:
+                self._abandoned(model)
+                raise
+            self._streamed(model, preferred, messages, chunks, start, served_by)
+            return
+
+    async def astream(self, messages, preferred, served_by=None, **kwargs):
+        tried, deadline = set(), time.monotonic() + self.max_wait
+        while True:
+            model, wait = self._schedule(preferred, tried)
+            if model is None:
+                if time.monotonic() + wait > deadline:
+                    METRICS.inc("models_exhausted_total")
+                    raise ModelsExhausted("Every model is currently rate limited.")
+                await asyncio.sleep(wait)
+                continue
+
+            tried.add(model)
+            chunks, start = [], time.perf_counter()
+            try:
+                async for chunk in self.chat_model(model).astream(messages, **kwargs):
+                    if not chunks:
+                        self._first_chunk(model, start)
+                    chunks.append(chunk)
+                    yield chunk
+            except Exception as e:
+                self._record(model, preferred, e)
+                if chunks or not is_quota_error(e):
+                    raise
+                continue
+            except BaseException:
+                self._abandoned(model)
+                raise
+            self._streamed(model, preferred, messages, chunks, start, served_by)
+            return
+
+    def stats(self):
+        return {
+            "models": {
+                model: {
+                    "circuit": self.breakers[model].state,
+                    "served": self.served[model],
+                    "quota_errors": self.quota_errors[model],
+                }
+                for model in self.known_models()
+            },
+            "fallbacks": self.fallbacks,
+        }
+
+
+class RoutedChatModel:
+    # Looks like a chat model to callers and remembers which model served each of its requests
+    # and the size of each prompt it sent.
+
+    def __init__(self, router, model):
+        self.router = router
+        self.model = model
+        self.served_by = []
+        self.prompt_sizes = []
+
+    def _sent(self, messages):
+        self.prompt_sizes.append(prompt_size(messages))
+        return messages
+
+    def invoke(self, messages, **kwargs):
+        return self.router.invoke(self._sent(messages), self.model, self.served_by, **kwargs)
+
+    async def ainvoke(self, messages, **kwargs):
+        return await self.router.ainvoke(self._sent(messages), self.model, self.served_by, **kwargs)
+
+    def stream(self, messages, **kwargs):
+        return self.router.stream(self._sent(messages), self.model, self.served_by, **kwargs)
+
+    def astream(self, messages, **kwargs):
+        return self.router.astream(self._sent(messages), self.model, self.served_by, **kwargs)
+
+    def prompt_usage(self):
+        return prompt_usage(self.prompt_sizes)
@@ -0,0 +1,77 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from speakable.cache import DiskCache, cache_key
+from speakable.metrics import METRICS
+
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+
+class ResponseCache:
+    # Two layers of cached model responses: a small in-process LRU in front of the SQLite store
+    # that every app process on the machine shares. Both layers honour the same ttl.
+
+    def __init__(self, name="llm_responses", max_entries=5000, memory_entries=256, ttl=7 * 24 * 3600):
+        self.disk = DiskCache(name, max_entries=max_entries, ttl=ttl)
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, model, prompt, text):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return cache_key(model, prompt_hash, normalize_text(text))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, value = entry
+                if self.ttl is None or now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    METRICS.inc("cache_lookups_total", cache=self.disk.name, result="memory_hit")
+                    return value
+                del self._memory[key]
+
+        value = self.disk.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                METRICS.inc("cache_lookups_total", cache=self.disk.name, result="miss")
+                return None
+            self.disk_hits += 1
+            METRICS.inc("cache_lookups_total", cache=self.disk.name, result="disk_hit")
+            self._remember(key, value, now)
+        return value
+
+    def set(self, key, value):
+        self.disk.set(key, value)
+        with self._lock:
+            self._remember(key, value, time.time())
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.disk),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
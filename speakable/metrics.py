@@ -0,0 +1,223 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+from speakable.cache import CACHE_DIR
+
+# Counters and latency histograms for the whole app process, exported in the Prometheus text
+# format. Every finished span is also written to a rolling JSONL event log, and requests marked
+# for profiling are traced with cProfile (or the torch profiler) and kept when they were slow.
+#
+#   SPEAKABLE_METRICS_PORT=9464    serves /metrics for Prometheus to scrape
+#   SPEAKABLE_PROFILE=cprofile     keeps .prof files of requests slower than SPEAKABLE_PROFILE_SLOW_SECONDS
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROFILE_DIR = os.path.join(CACHE_DIR, "profiles")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f"{name}=\"{_escape(value)}\"" for name, value in pairs) + "}"
+
+
+def _message_chars(messages):
+    chars = 0
+    for message in messages:
+        content = message[1] if isinstance(message, tuple) else getattr(message, "content", message)
+        chars += len(str(content))
+    return chars
+
+
+class Metrics:
+    def __init__(self, event_log=None, event_log_bytes=10 * 1024 * 1024, event_log_backups=3,
+                 profile=None, slow_seconds=5.0, profile_dir=PROFILE_DIR):
+        self.event_log = event_log
+        self.event_log_bytes = event_log_bytes
+        self.event_log_backups = event_log_backups
+        self.profile = profile
+        self.slow_seconds = slow_seconds
+        self.profile_dir = profile_dir
+
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._logger = None
+        # Only one cProfile profiler can be active per process; concurrent requests run unprofiled.
+        self._profile_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            event_log=os.getenv("SPEAKABLE_EVENT_LOG", os.path.join(CACHE_DIR, "metrics", "events.jsonl")) or None,
+            event_log_bytes=int(float(os.getenv("SPEAKABLE_EVENT_LOG_MB", "10")) * 1024 * 1024),
+            profile=os.getenv("SPEAKABLE_PROFILE") or None,
+            slow_seconds=float(os.getenv("SPEAKABLE_PROFILE_SLOW_SECONDS", "5")),
+        )
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, seconds, **labels):
+        key = name, tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    @contextmanager
+    def span(self, stage, profile=False, **labels):
+        # Times the block as stage_seconds{stage=...}. With profile=True the block is also
+        # profiled when profiling is switched on.
+        start = time.perf_counter()
+        error = None
+        with self._profiled(stage, start) if profile and self.profile else nullcontext():
+            try:
+                yield
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                self.observe("stage_seconds", seconds, stage=stage, **labels)
+                if error is not None:
+                    self.inc("stage_errors_total", stage=stage, error=error, **labels)
+                self.log_event({"stage": stage, "seconds": round(seconds, 4), "error": error, **labels})
+
+    def record_llm(self, model, messages, response):
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.inc("llm_requests_total", model=model)
+        self.inc("llm_prompt_chars_total", _message_chars(messages), model=model)
+        self.inc("llm_response_chars_total", len(response.content), model=model)
+        self.inc("llm_input_tokens_total", usage.get("input_tokens", 0), model=model)
+        self.inc("llm_output_tokens_total", usage.get("output_tokens", 0), model=model)
+
+    def log_event(self, event):
+        if self.event_log is None:
+            return
+        if self._logger is None:
+            with self._lock:
+                if self._logger is None:
+                    os.makedirs(os.path.dirname(self.event_log) or ".", exist_ok=True)
+                    handler = RotatingFileHandler(
+                        self.event_log, maxBytes=self.event_log_bytes, backupCount=self.event_log_backups, encoding="utf-8"
+                    )
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    logger = logging.getLogger("speakable.events")
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    logger.addHandler(handler)
+                    self._logger = logger
+        self._logger.info(json.dumps({"time": round(time.time(), 3), **event}, ensure_ascii=False))
+
+    @contextmanager
+    def _profiled(self, stage, start):
+        if self.profile == "torch":
+            import torch.profiler
+
+            with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU]) as profiler:
+                yield
+            if time.perf_counter() - start >= self.slow_seconds:
+                profiler.export_chrome_trace(self._profile_path(stage, "json"))
+            return
+
+        import cProfile
+
+        if not self._profile_lock.acquire(blocking=False):
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+            if time.perf_counter() - start >= self.slow_seconds:
+                profiler.dump_stats(self._profile_path(stage, "prof"))
+        finally:
+            self._profile_lock.release()
+
+    def _profile_path(self, stage, extension):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.inc("slow_requests_profiled_total", stage=stage)
+        return os.path.join(self.profile_dir, f"{stage}-{time.strftime('%Y%m%d-%H%M%S')}-{threading.get_ident()}.{extension}")
+
+    def snapshot(self):
+        with self._lock:
+            counters = {
+                name + _format_labels(labels): value for (name, labels), value in sorted(self._counters.items())
+            }
+            spans = {
+                name + _format_labels(labels): {
+                    "count": histogram["count"],
+                    "mean_ms": round(histogram["sum"] / histogram["count"] * 1000, 1),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            }
+        return {"counters": counters, "spans": spans}
+
+    def prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, {**histogram, "buckets": list(histogram["buckets"])}) for key, histogram in self._histograms.items()
+            )
+
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE speakable_{name} counter")
+                typed.add(name)
+            lines.append(f"speakable_{name}{_format_labels(labels)} {value:g}")
+
+        for (name, labels), histogram in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE speakable_{name} histogram")
+                typed.add(name)
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                lines.append(f"speakable_{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {count}")
+            lines.append(f"speakable_{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"speakable_{name}_sum{_format_labels(labels)} {histogram['sum']:g}")
+            lines.append(f"speakable_{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics.from_env()
+
+
+def serve_prometheus(port, metrics=METRICS):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="speakable-metrics", daemon=True).start()
+    return server
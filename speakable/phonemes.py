@@ -0,0 +1,59 @@
+import threading
+
+from speakable.cache import DiskCache, cache_key
+from speakable.metrics import METRICS
+
+_backends = {}
+_backends_lock = threading.Lock()
+_reference_cache = None
+
+
+def clean_ipa(ipa):
+    return ipa.replace(":", "").replace("'", "").replace("ˌ", "").strip()
+
+
+def get_backend(language="en-us"):
+    # Starting espeak is the expensive part of phonemizing a sentence, so every language keeps
+    # a single backend. The espeak library is not thread safe, hence the lock next to it.
+    with _backends_lock:
+        if language not in _backends:
+            from phonemizer.backend import EspeakBackend
+
+            _backends[language] = (EspeakBackend(language), threading.Lock())
+        return _backends[language]
+
+
+def backend_version(backend):
+    import phonemizer
+
+    return f"phonemizer-{phonemizer.__version__}/{backend.name()}-{'.'.join(map(str, backend.version()))}"
+
+
+def get_reference_cache():
+    global _reference_cache
+    if _reference_cache is None:
+        _reference_cache = DiskCache("reference_ipa", max_entries=100000)
+    return _reference_cache
+
+
+def phonemize_sentences(sentences, language="en-us"):
+    backend, lock = get_backend(language)
+    version = backend_version(backend)
+    cache = get_reference_cache()
+
+    keys = [cache_key(version, language, sentence) for sentence in sentences]
+    cached = cache.get_many(keys)
+    METRICS.inc("cache_lookups_total", sum(key in cached for key in keys), cache=cache.name, result="disk_hit")
+    METRICS.inc("cache_lookups_total", sum(key not in cached for key in keys), cache=cache.name, result="miss")
+
+    missing = list(dict.fromkeys(
+        sentence for sentence, key in zip(sentences, keys) if key not in cached
+    ))
+    if missing:
+        with lock:
+            phonemized = backend.phonemize(missing, strip=True, njobs=1)
+        fresh = {cache_key(version, language, s): ipa for s, ipa in zip(missing, phonemized)}
+        cache.set_many(fresh)
+        cached.update(fresh)
+
+    return [cached[key] for key in keys]
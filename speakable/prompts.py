@@ -0,0 +1,94 @@
+import hashlib
+import os
+
+from speakable.metrics import METRICS
+
+# Prompts are built from a static system prefix, identical byte for byte on every request so
+# providers can cache it, and a per-request part. Sizes are counted locally, before anything is
+# sent, and checked against a token budget.
+
+# Gemini averages about four characters per token on English text. Non-ASCII characters (IPA
+# symbols, accents) are counted as a token each, which errs on the side of overcounting.
+CHARS_PER_TOKEN = 4
+
+
+def prompt_budget():
+    # Read on every use rather than at import, so a budget set in .env is picked up.
+    return int(os.getenv("SPEAKABLE_PROMPT_BUDGET", "4096"))
+
+
+class PromptTooLarge(ValueError):
+    pass
+
+
+def count_tokens(text):
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return -(-ascii_chars // CHARS_PER_TOKEN) + len(text) - ascii_chars
+
+
+def prompt_size(messages):
+    # The first message is the static prefix; everything after it changes per request.
+    prefix = count_tokens(messages[0][1]) if messages else 0
+    request = sum(count_tokens(content) for _, content in messages[1:])
+    return {"prefix_tokens": prefix, "request_tokens": request, "total_tokens": prefix + request}
+
+
+def prompt_usage(sizes):
+    # Sums the sizes of the prompts sent for one user request, which may take several calls.
+    return {
+        "requests": len(sizes),
+        "prefix_tokens": sum(size["prefix_tokens"] for size in sizes),
+        "request_tokens": sum(size["request_tokens"] for size in sizes),
+        "total_tokens": sum(size["total_tokens"] for size in sizes),
+        "largest_tokens": max((size["total_tokens"] for size in sizes), default=0),
+        "budget": prompt_budget(),
+    }
+
+
+class PromptTemplate:
+    # context is an optional per-request system message with a {context} field. It is only
+    # background, so it is left out when it would push the prompt over the budget; the human
+    # message never is, and a prompt that is too large without context raises PromptTooLarge.
+
+    def __init__(self, name, prefix, context=None, budget=None):
+        self.name = name
+        self.prefix = prefix
+        self.context = context
+        self._budget = budget
+        self.prefix_tokens = count_tokens(prefix)
+        self.prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    @property
+    def budget(self):
+        # A budget given explicitly wins; otherwise SPEAKABLE_PROMPT_BUDGET applies.
+        return self._budget if self._budget is not None else prompt_budget()
+
+    def request_chars(self, reserve=0.25):
+        # Characters of human text that fit next to the prefix, keeping reserve of the room for context.
+        if not self.budget:
+            return None
+        return int((self.budget - self.prefix_tokens) * (1 - reserve)) * CHARS_PER_TOKEN
+
+    def _fits(self, messages):
+        return not self.budget or prompt_size(messages)["total_tokens"] <= self.budget
+
+    def build(self, human, context=None):
+        messages = [("system", self.prefix)]
+        if context and self.context is not None:
+            with_context = [*messages, ("system", self.context.format(context=context)), ("human", human)]
+            if self._fits(with_context):
+                messages = with_context[:-1]
+            else:
+                METRICS.inc("prompt_context_dropped_total", template=self.name)
+        messages.append(("human", human))
+
+        size = prompt_size(messages)
+        if not self._fits(messages):
+            METRICS.inc("prompt_budget_exceeded_total", template=self.name)
+            raise PromptTooLarge(
+                f"The {self.name} prompt needs about {size['total_tokens']} tokens, more than the budget of {self.budget}."
+            )
+        METRICS.inc("prompt_requests_total", template=self.name)
+        METRICS.inc("prompt_tokens_total", size["prefix_tokens"], template=self.name, part="prefix")
+        METRICS.inc("prompt_tokens_total", size["request_tokens"], template=self.name, part="request")
+        return messages
@@ -0,0 +1,208 @@
+import hashlib
+import os
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from speakable.alignment import align, written_words
+from speakable.audio import decode_audio
+from speakable.cache import cache_key
+from speakable.gop import score_pronunciation
+from speakable.inference import MODEL_ID, SAMPLE_RATE
+from speakable.llm_cache import normalize_text
+from speakable.metrics import METRICS
+from speakable.phonemes import clean_ipa
+from speakable.prompts import PromptTemplate
+from speakable.streaming import StreamingRecognizer, iter_blocks
+from speakable.vad import detect_speech, speech_stats
+
+# The Pronunciation pipeline without any UI: recording bytes in, recognised phonemes, word
+# scores and the summary the AI coach is given out. Progress is reported through on_event.
+
+# The instructions are the same for every recording and form the static prefix; only the
+# transcriptions, the score and the word differences are sent per request.
+FEEDBACK_PROMPT = """
+    You are given an ipa transcription that has been generated from the audio file of a user reading a sentence, the sentence the user is trying to say and its ipa transcription. The ipa transcription generated from the audio file has a space between each phoneme, while the ipa transcription of the sentence has a space between each word.
+
+    You are also given the pronunciation score computed from the audio, out of 100, and the words that scored lowest with the differences between the ipa transcription and the phonemes for each of them.
+    The user's native language is English, the user's target language is English, and the user's efficiency level is Beginner.
+
+    Your return should be in the following format:
+    \\n- Word that was mispronounced: description of how to improve pronunciation of word and what the word sounds like in simple transcription, like for the word \"How\" it can be pronounced as \"ow\".
+
+    \\n- Lastly you should explain to the user why they achieved their score.
+
+    Strictly ensure you follow the above format.
+    Strictly ensure that you do not include any ipa transcription or complex symbols in your return, instead replace it with the actual part of the word or sentence for better understanding.
+    """
+
+FEEDBACK_REQUEST = """ipa transcription generated from the audio file: {human}
+The user is trying to say: \"{sentence}\"; in ipa transcription, it is: {ipa}
+Pronunciation score: {score:.0f} out of 100.
+Lowest scoring words: {contents_str}"""
+
+FEEDBACK = PromptTemplate("feedback", FEEDBACK_PROMPT)
+
+
+def vad_options_from_env():
+    if os.getenv("SPEAKABLE_VAD", "1") == "0":
+        return None
+    return {
+        "margin_db": float(os.getenv("SPEAKABLE_VAD_MARGIN_DB", "15")),
+        "padding_ms": float(os.getenv("SPEAKABLE_VAD_PADDING_MS", "150")),
+        "split_pause_ms": float(os.getenv("SPEAKABLE_VAD_SPLIT_PAUSE_MS", "600")),
+    }
+
+
+def feedback_messages(human, ipa, sentence, score, contents_str):
+    return FEEDBACK.build(
+        FEEDBACK_REQUEST.format(human=human, sentence=sentence, ipa=ipa, score=score, contents_str=contents_str)
+    )
+
+
+def pipeline_key(audio_bytes, sentence, vad_options, gop_threshold):
+    # Everything that changes the outcome for the same recording is part of the key.
+    return cache_key(
+        hashlib.sha256(audio_bytes).hexdigest(),
+        normalize_text(sentence),
+        MODEL_ID,
+        os.getenv("SPEAKABLE_BACKEND", "fp32"),
+        repr(vad_options),
+        gop_threshold
+    )
+
+
+def recognize_stream(engine, samples, chunk_seconds=8, on_event=None):
+    # Long recordings are recognised window by window so memory stays bounded and the
+    # transcript can be reported while the rest of the audio is still being processed.
+    recognizer = StreamingRecognizer(engine, chunk_seconds=chunk_seconds)
+    for partial in recognizer.stream(iter_blocks(samples)):
+        if on_event is not None and partial:
+            on_event({"event": "partial", "ipa": clean_ipa(partial)})
+
+    return partial, recognizer.logits()
+
+
+def phonemize_audio(engine, samples, speech=None, chunk_seconds=8, on_event=None):
+    import torch
+
+    # Silence is cut away first; the speech segments left over are submitted together so the
+    # engine can batch them, and only segments longer than one chunk are streamed. Besides the
+    # text and the concatenated logits, returns (first frame, start in seconds) for each segment
+    # so frames can be placed back on the recording's timeline.
+    bounds = speech.segments if speech is not None else [(0, len(samples))]
+    segments = [samples[start:end] for start, end in bounds]
+    if not segments:
+        return "", torch.zeros(0, engine.model.config.vocab_size), []
+
+    pending = [
+        engine.submit(segment) if len(segment) <= chunk_seconds * SAMPLE_RATE else segment
+        for segment in segments
+    ]
+    results = [
+        item.result() if isinstance(item, Future) else recognize_stream(engine, item, chunk_seconds, on_event)
+        for item in pending
+    ]
+
+    offsets, frame = [], 0
+    for (start, _), (_, logits) in zip(bounds, results):
+        offsets.append((frame, start / SAMPLE_RATE))
+        frame += len(logits)
+
+    text = " ".join(clean_ipa(text) for text, _ in results)
+    return text.strip(), torch.cat([logits for _, logits in results]), offsets
+
+
+def generate_content_str(alignment, word_indices=None):
+    contents_str = "The key differences in the string are highlighted below, word by word: "
+    for index, word in enumerate(alignment.words):
+        if word_indices is not None and index not in word_indices:
+            continue
+        runs = []
+        for tag, spoken, reference in word.ops:
+            if runs and runs[-1][0] == tag:
+                runs[-1] = (tag, runs[-1][1] + spoken, runs[-1][2] + reference)
+            else:
+                runs.append((tag, spoken, reference))
+
+        parts = []
+        for tag, spoken, reference in runs:
+            if tag == 'equal':
+                parts.append(f"Same({spoken})")
+            elif tag == 'replace':
+                parts.append(f"Replace({spoken} with {reference})")
+            elif tag == 'delete':
+                parts.append(f"Delete({spoken})")
+            elif tag == 'insert':
+                parts.append(f"Insert({reference})")
+
+        label = f"\"{word.word}\" ({word.reference})" if word.word else word.reference
+        contents_str += f" {label}: {', '.join(parts)}; "
+    contents_str = contents_str.removesuffix("; ")
+
+    return contents_str
+
+
+def assess_pronunciation(
+    engine,
+    audio_bytes,
+    sentence,
+    ipa,
+    vad_options=None,
+    chunk_seconds=8,
+    gop_threshold=70,
+    on_event=None
+):
+    timings = {}
+    samples = decode_audio(audio_bytes, timings)
+
+    start = time.perf_counter()
+    speech = detect_speech(samples, **vad_options) if vad_options is not None else None
+    timings["vad"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    human_ipa, logits, offsets = phonemize_audio(engine, samples, speech, chunk_seconds, on_event)
+    timings["recognise"] = time.perf_counter() - start
+
+    words = written_words(sentence)
+    alignment = align(human_ipa, ipa, words=words)
+
+    # Scores come from the speech model itself, so they are available without waiting for the AI coach.
+    start = time.perf_counter()
+    pronunciation = score_pronunciation(
+        logits,
+        engine.processor,
+        ipa,
+        words,
+        frame_seconds=np.prod(engine.model.config.conv_stride) / SAMPLE_RATE,
+        segments=offsets
+    )
+    timings["score"] = time.perf_counter() - start
+
+    if pronunciation is not None:
+        score = pronunciation.score
+        word_scores = [
+            (word.index, word.word or word.reference, word.score, round(word.start, 2), round(word.end, 2))
+            for word in pronunciation.words
+        ]
+    else:
+        score = 100 * alignment.ratio
+        word_scores = [(i, word.word or word.reference, 100 * word.score, None, None) for i, word in enumerate(alignment.words)]
+
+    low_scoring = {index for index, _, word_score, _, _ in word_scores if word_score < gop_threshold}
+    for stage, seconds in timings.items():
+        METRICS.observe("stage_seconds", seconds, stage=stage, page="pronunciation")
+
+    # Only plain values are kept so the result can be stored in the shared cache and sent as JSON.
+    return {
+        "sentence": sentence,
+        "human_ipa": human_ipa,
+        "reference_ipa": ipa,
+        "score": score,
+        "word_scores": [list(row) for row in word_scores],
+        "low_scoring": sorted(low_scoring),
+        "contents_str": generate_content_str(alignment, low_scoring),
+        "timings": timings,
+        "voice_activity": speech_stats(speech) if speech is not None else None,
+    }
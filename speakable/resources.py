@@ -0,0 +1,45 @@
+import os
+
+import streamlit as st
+
+# Settings in .env are loaded before any speakable module reads the environment, so pages
+# import this module ahead of the others.
+import speakable.env
+from speakable.metrics import serve_prometheus
+from speakable.service import PronunciationService, TextAnalysisService, router_from_env
+from speakable.startup import ensure_nltk_data, start_background_warmup
+
+# Resources shared by every page and session of the Streamlit server.
+
+
+@st.cache_data(show_spinner="Downloading dependencies...")
+def install_dependencies():
+    ensure_nltk_data()
+
+
+@st.cache_resource
+def start_warmup():
+    # Runs once per server; the first page view of any page starts loading the speech model.
+    start_background_warmup()
+
+
+@st.cache_resource
+def start_metrics_exporter():
+    # Prometheus scrapes http://<host>:<port>/metrics when SPEAKABLE_METRICS_PORT is set.
+    port = os.getenv("SPEAKABLE_METRICS_PORT")
+    return serve_prometheus(int(port)) if port else None
+
+
+@st.cache_resource
+def load_router():
+    return router_from_env()
+
+
+@st.cache_resource
+def load_text_service():
+    return TextAnalysisService.from_env(load_router())
+
+
+@st.cache_resource
+def load_pronunciation_service():
+    return PronunciationService.from_env(load_router())
@@ -0,0 +1,291 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from speakable.cache import cache_key
+from speakable.llm import DEFAULT_MODEL, MODELS, ModelRouter
+from speakable.llm_cache import ResponseCache, normalize_text
+from speakable.metrics import METRICS
+from speakable.text_analysis import TEXT_ANALYSIS
+
+# The Text Analysis and Pronunciation flows as a library, used by the Streamlit pages and by the
+# HTTP API (speakable.api). Concurrency limits and router state belong to one process, so the
+# Streamlit server and a uvicorn API server each enforce their own; response caches live on disk
+# and are shared. Every blocking entry point has an async twin that runs it on the service's own
+# threads.
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Limiter:
+    # At most max_running requests run at once and at most max_waiting wait for a slot; anything
+    # beyond that is turned away with Overloaded instead of queueing without bound.
+
+    def __init__(self, max_running, max_waiting, timeout=None):
+        self.max_running = max_running
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+        self._slots = threading.BoundedSemaphore(max_running)
+        self._lock = threading.Lock()
+        # One thread per request that may run or wait, so admitted requests never queue unseen
+        # behind another service's in a shared pool.
+        self._executor = ThreadPoolExecutor(max_running + max_waiting, thread_name_prefix="speakable-service")
+
+    def _leave(self, future):
+        with self._lock:
+            self.admitted -= 1
+
+    async def run(self, fn, *args, **kwargs):
+        # Runs fn on this limiter's threads. The admission check happens here, on the event loop,
+        # before anything is handed to a thread. A request stays admitted until its thread is done,
+        # even if the caller stops waiting for it.
+        with self._lock:
+            if self.admitted >= self.max_running + self.max_waiting:
+                self.rejected += 1
+                raise Overloaded("Too many requests are waiting.")
+            self.admitted += 1
+        try:
+            future = self._executor.submit(partial(fn, *args, **kwargs))
+        except BaseException:
+            self._leave(None)
+            raise
+        future.add_done_callback(self._leave)
+        return await asyncio.wrap_future(future)
+
+    @contextmanager
+    def slot(self):
+        # Only a request that finds every slot taken counts as waiting.
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise Overloaded("Too many requests are waiting.")
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self.rejected += 1
+                raise Overloaded("Timed out waiting for a free slot.")
+
+        with self._lock:
+            self.running += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.running -= 1
+            self._slots.release()
+
+    def stats(self):
+        return {"running": self.running, "waiting": self.waiting, "admitted": self.admitted, "rejected": self.rejected}
+
+
+def check_model(model):
+    if model not in MODELS.values():
+        raise ValueError(f"Unknown model {model!r}.")
+    return model
+
+
+def _limiter_from_env(prefix, max_running, max_waiting):
+    return Limiter(
+        int(os.getenv(f"SPEAKABLE_{prefix}_CONCURRENCY", str(max_running))),
+        int(os.getenv(f"SPEAKABLE_{prefix}_QUEUE", str(max_waiting))),
+        timeout=float(os.getenv("SPEAKABLE_QUEUE_TIMEOUT", "60"))
+    )
+
+
+def router_from_env():
+    return ModelRouter(
+        requests_per_minute=float(os.getenv("SPEAKABLE_MODEL_RPM", "15")),
+        cooldown=float(os.getenv("SPEAKABLE_MODEL_COOLDOWN", "60"))
+    )
+
+
+class TextAnalysisService:
+    def __init__(self, router, cache=None, limiter=None, max_chars=2000, max_concurrency=4, requests_per_minute=0):
+        self.router = router
+        self.cache = cache
+        self.limiter = limiter or Limiter(8, 32)
+        # Chunks are kept small enough for each request to fit in the prompt budget.
+        budget_chars = TEXT_ANALYSIS.request_chars()
+        self.options = {
+            "max_chars": min(max_chars, budget_chars) if budget_chars else max_chars,
+            "max_concurrency": max_concurrency,
+            "requests_per_minute": requests_per_minute,
+        }
+
+    @classmethod
+    def from_env(cls, router):
+        return cls(
+            router,
+            cache=ResponseCache(
+                max_entries=int(os.getenv("SPEAKABLE_LLM_CACHE_ENTRIES", "5000")),
+                ttl=float(os.getenv("SPEAKABLE_LLM_CACHE_TTL_HOURS", "168")) * 3600
+            ),
+            limiter=_limiter_from_env("TEXT_ANALYSIS", 8, 32),
+            max_chars=int(os.getenv("SPEAKABLE_CHUNK_CHARS", "2000")),
+            max_concurrency=int(os.getenv("SPEAKABLE_LLM_CONCURRENCY", "4")),
+            requests_per_minute=float(os.getenv("SPEAKABLE_LLM_RPM", "0"))
+        )
+
+    def analyse(self, text, model=DEFAULT_MODEL, previous=None, on_event=None):
+        # Returns (data, state, served_by, prompt), where prompt sums up the size of the prompts
+        # sent. Passing the state of the previous analysis back in only sends the sentences that
+        # changed since then.
+        from speakable.incremental import analyse_incrementally
+
+        if not text.strip():
+            raise ValueError("There is no text to analyse.")
+        llm = self.router.client(check_model(model))
+        with self.limiter.slot(), METRICS.span("text_analysis", profile=True, page="text_analysis"):
+            on_entry = None
+            if on_event is not None:
+                on_event({"event": "accepted"})
+                # Corrections are passed on as the model writes them, numbered by their sentence in text.
+                on_entry = lambda index, entry: on_event({"event": "correction", "index": index, "entry": entry})
+            data, state = analyse_incrementally(
+                llm, model, text, previous=previous, cache=self.cache, on_entry=on_entry, **self.options
+            )
+        return data, state, sorted(set(llm.served_by)), llm.prompt_usage()
+
+    async def aanalyse(self, text, model=DEFAULT_MODEL, previous=None, on_event=None):
+        return await self.limiter.run(self.analyse, text, model, previous, on_event)
+
+    def stats(self):
+        return {"requests": self.limiter.stats(), "cache": self.cache.stats() if self.cache is not None else None}
+
+
+class PronunciationService:
+    def __init__(
+        self,
+        router,
+        engine_loader=None,
+        cache=None,
+        limiter=None,
+        vad_options=None,
+        chunk_seconds=8,
+        gop_threshold=70
+    ):
+        if engine_loader is None:
+            from speakable.startup import load_inference_engine
+
+            engine_loader = load_inference_engine
+        self.router = router
+        self.engine_loader = engine_loader
+        self.cache = cache
+        self.limiter = limiter or Limiter(4, 16)
+        self.vad_options = vad_options
+        self.chunk_seconds = chunk_seconds
+        self.gop_threshold = gop_threshold
+
+    @classmethod
+    def from_env(cls, router):
+        from speakable.pronunciation import vad_options_from_env
+
+        return cls(
+            router,
+            cache=ResponseCache(
+                name="pronunciation",
+                max_entries=int(os.getenv("SPEAKABLE_PRONUNCIATION_CACHE_ENTRIES", "2000")),
+                ttl=float(os.getenv("SPEAKABLE_LLM_CACHE_TTL_HOURS", "168")) * 3600
+            ),
+            limiter=_limiter_from_env("PRONUNCIATION", 4, 16),
+            vad_options=vad_options_from_env(),
+            chunk_seconds=float(os.getenv("SPEAKABLE_STREAMING_CHUNK_SECONDS", "8")),
+            gop_threshold=float(os.getenv("SPEAKABLE_GOP_THRESHOLD", "70"))
+        )
+
+    def reference_ipa(self, sentences):
+        from speakable.phonemes import clean_ipa, phonemize_sentences
+
+        return [clean_ipa(ipa) for ipa in phonemize_sentences(sentences, language="en-us")]
+
+    def key(self, audio_bytes, sentence):
+        from speakable.pronunciation import pipeline_key
+
+        return pipeline_key(audio_bytes, sentence, self.vad_options, self.gop_threshold)
+
+    def _cached(self, key, compute):
+        value = self.cache.get(key) if self.cache is not None else None
+        if value is None:
+            value = compute()
+            if self.cache is not None:
+                self.cache.set(key, value)
+        return value
+
+    def assess(self, audio_bytes, sentence, on_event=None):
+        # An unchanged recording of the same sentence is answered from the cache.
+        from speakable.pronunciation import assess_pronunciation
+
+        if not audio_bytes:
+            raise ValueError("The recording is empty.")
+        key = self.key(audio_bytes, sentence)
+
+        def compute():
+            with self.limiter.slot(), METRICS.span("pronunciation", profile=True, page="pronunciation"):
+                if on_event is not None:
+                    on_event({"event": "accepted"})
+                ipa, = self.reference_ipa([sentence])
+                return assess_pronunciation(
+                    self.engine_loader(),
+                    audio_bytes,
+                    sentence,
+                    ipa,
+                    self.vad_options,
+                    self.chunk_seconds,
+                    self.gop_threshold,
+                    on_event
+                )
+        return {**self._cached(key, compute), "key": key}
+
+    def _assessment(self, result, sentence):
+        # API clients send the result back, so only its key is trusted: the prompt is built from
+        # the assessment cached under that key, never from client-supplied transcriptions. Without
+        # a cache there is nothing to trust, so feedback is refused.
+        if self.cache is None:
+            raise ValueError("Feedback needs the pronunciation cache to look up the assessment.")
+        assessment = self.cache.get(str(result.get("key", "")))
+        if assessment is None:
+            raise ValueError("Unknown or expired pronunciation result. Please assess the recording again.")
+        if normalize_text(assessment.get("sentence", sentence)) != normalize_text(sentence):
+            raise ValueError("The pronunciation result is for a different sentence.")
+        return assessment
+
+    def feedback(self, result, sentence, model=DEFAULT_MODEL):
+        # Returns (feedback, prompt). result is what assess returned for the sentence.
+        from speakable.pronunciation import feedback_messages
+
+        llm = self.router.client(check_model(model))
+        assessment = self._assessment(result, sentence)
+        messages = feedback_messages(
+            assessment["human_ipa"], assessment["reference_ipa"], sentence, assessment["score"], assessment["contents_str"]
+        )
+
+        def compute():
+            with self.limiter.slot(), METRICS.span("feedback", page="pronunciation"):
+                return llm.invoke(messages).content
+        feedback = self._cached(cache_key("feedback", model, *(content for _, content in messages)), compute)
+        return feedback, llm.prompt_usage()
+
+    async def aassess(self, audio_bytes, sentence, on_event=None):
+        return await self.limiter.run(self.assess, audio_bytes, sentence, on_event)
+
+    async def afeedback(self, result, sentence, model=DEFAULT_MODEL):
+        return await self.limiter.run(self.feedback, result, sentence, model)
+
+    def stats(self):
+        return {"requests": self.limiter.stats(), "cache": self.cache.stats() if self.cache is not None else None}
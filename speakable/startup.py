@@ -0,0 +1,151 @@
+import importlib
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from speakable.inference import MODEL_ID, SAMPLE_RATE
+
+# Heavy libraries (torch, transformers, espeak) are only imported when the speech model is first
+# needed. warm_up does all of that once in a background thread when the server starts, so the
+# first recording does not pay for it, and records how long every step took.
+
+TIMINGS = {}
+
+_lock = threading.RLock()
+_speech_model = None
+_engine = None
+_local_engine = None
+_warmup = {"state": "not started", "error": None}
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS[stage] = round(time.perf_counter() - start, 3)
+
+
+def timed_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    with timed(f"import {name}"):
+        return importlib.import_module(name)
+
+
+def ensure_nltk_data():
+    nltk = timed_import("nltk")
+    try:
+        nltk.data.find('tokenizers/punkt')
+        nltk.data.find('tokenizers/punkt_tab')
+    except LookupError:
+        with timed("download punkt"):
+            nltk.download('punkt')
+            nltk.download('punkt_tab')
+
+
+def load_model_ipa_model():
+    global _speech_model
+    with _lock:
+        if _speech_model is None:
+            timed_import("torch")
+            transformers = timed_import("transformers")
+            backends = timed_import("speakable.backends")
+
+            with timed("load speech model"):
+                processor = transformers.Wav2Vec2Processor.from_pretrained(MODEL_ID)
+                model = backends.load_backend(
+                    os.getenv("SPEAKABLE_BACKEND", "fp32"),
+                    transformers.Wav2Vec2ForCTC.from_pretrained(MODEL_ID, use_safetensors=True),
+                    num_threads=os.getenv("SPEAKABLE_NUM_THREADS")
+                )
+            _speech_model = processor, model
+        return _speech_model
+
+
+def load_local_engine():
+    global _local_engine
+    with _lock:
+        if _local_engine is None:
+            from speakable.inference import BatchingEngine
+
+            processor, model = load_model_ipa_model()
+            _local_engine = BatchingEngine(
+                processor,
+                model,
+                max_batch_size=int(os.getenv("SPEAKABLE_MAX_BATCH_SIZE", "8")),
+                max_wait_ms=float(os.getenv("SPEAKABLE_MAX_WAIT_MS", "50"))
+            )
+        return _local_engine
+
+
+def load_inference_engine():
+    # With SPEAKABLE_WORKER_ADDRESS set and the worker running, recognition is handed to the
+    # worker process and this process never loads the model weights; otherwise it runs in process.
+    global _engine
+    with _lock:
+        if _engine is None:
+            address = os.getenv("SPEAKABLE_WORKER_ADDRESS")
+            worker = timed_import("speakable.worker") if address else None
+            if worker is not None and worker.worker_available(address):
+                with timed("connect inference worker"):
+                    _engine = worker.WorkerClient(address, fallback=load_local_engine)
+            else:
+                _engine = load_local_engine()
+        return _engine
+
+
+def speech_model_ready():
+    return _engine is not None
+
+
+def synthetic_speech(seconds=1.0):
+    # A voiced-sounding test signal: a decaying harmonic series with a little noise.
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    signal = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 6))
+    noise = np.random.default_rng(0).normal(0, 0.01, len(t))
+    return (0.1 * signal * np.exp(-t) + noise).astype(np.float32)
+
+
+def warm_up():
+    _warmup["state"] = "running"
+    try:
+        with timed("warm up total"):
+            ensure_nltk_data()
+
+            from speakable.phonemes import phonemize_sentences
+
+            with timed("warm up espeak"):
+                phonemize_sentences(["Hello, how are you?"])
+
+            engine = load_inference_engine()
+            with timed("warm up inference"):
+                engine.recognize(synthetic_speech())
+    except Exception as e:
+        _warmup["state"] = "failed"
+        _warmup["error"] = repr(e)
+        return
+    _warmup["state"] = "done"
+
+
+def start_background_warmup():
+    with _lock:
+        if _warmup["state"] != "not started" or os.getenv("SPEAKABLE_WARMUP", "1") == "0":
+            return
+        _warmup["state"] = "starting"
+    threading.Thread(target=warm_up, name="speakable-warmup", daemon=True).start()
+
+
+def startup_report():
+    return {"warm_up": _warmup["state"], "error": _warmup["error"], "timings": dict(TIMINGS)}
+
+
+if __name__ == "__main__":
+    # Run ahead of a deploy to download the NLTK data and model weights into their caches.
+    warm_up()
+    print(startup_report())
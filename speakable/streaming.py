@@ -0,0 +1,96 @@
+import numpy as np
+
+from speakable.inference import SAMPLE_RATE
+
+
+class StreamingRecognizer:
+    # Runs the CTC model over overlapping windows as audio arrives. Every window is padded with
+    # context_seconds of audio on both sides, but only the frames of its own chunk are kept, so
+    # the stitched frame sequence matches a single forward pass without its peak memory.
+
+    def __init__(self, engine, chunk_seconds=8.0, context_seconds=1.0):
+        self.engine = engine
+        config = engine.model.config
+        self.frame_samples = int(np.prod(config.conv_stride))
+        self.receptive_field = receptive_field(config.conv_kernel, config.conv_stride)
+        self.chunk_samples = self._to_frames(chunk_seconds) * self.frame_samples
+        self.context_samples = self._to_frames(context_seconds) * self.frame_samples
+
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._buffer_start = 0
+        self._committed = 0
+        self._frame_ids = []
+        self._logits = []
+
+    def _to_frames(self, seconds):
+        return max(1, int(round(seconds * SAMPLE_RATE / self.frame_samples)))
+
+    @property
+    def received(self):
+        return self._buffer_start + len(self._buffer)
+
+    def feed(self, samples):
+        self._buffer = np.concatenate([self._buffer, np.asarray(samples, dtype=np.float32)])
+        while self.received >= self._committed + self.chunk_samples + self.context_samples:
+            self._step(self._committed + self.chunk_samples, final=False)
+        return self.transcript()
+
+    def finish(self):
+        while self._committed < self.received:
+            stop = min(self._committed + self.chunk_samples, self.received)
+            self._step(stop, final=stop == self.received)
+        return self.transcript()
+
+    def stream(self, blocks):
+        for block in blocks:
+            yield self.feed(block)
+        yield self.finish()
+
+    def transcript(self):
+        import torch
+
+        if not self._frame_ids:
+            return ""
+        # Decoding the whole stitched sequence lets CTC collapse repeats across chunk boundaries.
+        return self.engine.processor.decode(torch.tensor(self._frame_ids))
+
+    def logits(self):
+        import torch
+
+        return torch.cat(self._logits) if self._logits else torch.zeros(0, self.engine.model.config.vocab_size)
+
+    def _step(self, stop, final):
+        import torch
+
+        window_start = max(self._buffer_start, self._committed - self.context_samples)
+        window_end = self.received if final else min(self.received, stop + self.context_samples)
+        window = self._buffer[window_start - self._buffer_start:window_end - self._buffer_start]
+
+        # The convolutional front end needs at least one receptive field of audio.
+        if len(window) >= self.receptive_field:
+            logits = self.engine.recognize(window).logits
+            first = (self._committed - window_start) // self.frame_samples
+            last = len(logits) if final else (stop - window_start) // self.frame_samples
+            self._logits.append(logits[first:last])
+            self._frame_ids.extend(torch.argmax(logits[first:last], dim=-1).tolist())
+
+        self._committed = stop
+
+        # Audio before the next window's left context is never needed again.
+        keep_from = max(self._buffer_start, self._committed - self.context_samples)
+        self._buffer = self._buffer[keep_from - self._buffer_start:]
+        self._buffer_start = keep_from
+
+
+def receptive_field(kernels, strides):
+    size, jump = 1, 1
+    for kernel, stride in zip(kernels, strides):
+        size += (kernel - 1) * jump
+        jump *= stride
+    return size
+
+
+def iter_blocks(samples, block_seconds=1.0):
+    block = int(block_seconds * SAMPLE_RATE)
+    for start in range(0, len(samples), block):
+        yield samples[start:start + block]
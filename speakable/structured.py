@@ -0,0 +1,189 @@
+import ast
+
+# Text Analysis replies are a Python list holding one dictionary:
+#
+#   [{"reviewed_text": ..., "explanation": [...], "score": ..., "sentences": [{...}, {...}]}]
+#
+# AnalysisStreamParser reads a reply while it streams in and hands out every entry of the
+# "sentences" list as soon as its closing brace arrives. When the whole reply does not parse,
+# whatever did complete is kept, so only the missing part has to be asked for again.
+
+ENTRY_KEYS = ("sentence number", "sentence", "review")
+SUMMARY_KEYS = ("reviewed_text", "explanation", "score")
+
+
+class PartialAnalysis(ValueError):
+    # Raised for a reply that broke off or went malformed. data holds the fields and corrections
+    # that did complete; the corrections of the first covered sentences of the request are
+    # known to be complete. covered is 0 when the summary fields were lost too.
+
+    def __init__(self, data, covered):
+        super().__init__(f"Incomplete analysis: corrections are complete for {covered} sentence(s).")
+        self.data = data
+        self.covered = covered
+
+
+def parse_reply(text):
+    # Raises ValueError or SyntaxError when the model did not return a valid Python literal.
+    text = text.strip().removeprefix("```python").removesuffix("```").strip()
+    return ast.literal_eval(text)[0]
+
+
+def _strings(value):
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, (list, tuple)):
+        raise ValueError(f"Expected a list of strings, got {type(value).__name__}.")
+    return [str(item) for item in value]
+
+
+def validate_entry(entry):
+    if not isinstance(entry, dict):
+        raise ValueError("A correction must be a dictionary.")
+    missing = [key for key in ENTRY_KEYS if key not in entry]
+    if missing:
+        raise ValueError(f"A correction is missing {', '.join(missing)}.")
+    return {
+        **entry,
+        "sentence number": str(entry["sentence number"]).strip(),
+        "sentence": str(entry["sentence"]),
+        "review": str(entry["review"]),
+        "section": _strings(entry.get("section", [])),
+        "subsection": _strings(entry.get("subsection", [])),
+    }
+
+
+def validate_analysis(data):
+    # Checks the reply against the schema the prompt asks for. Corrections that do not fit are
+    # dropped rather than failing the whole analysis.
+    if not isinstance(data, dict):
+        raise ValueError("The analysis must be a dictionary.")
+    missing = [key for key in SUMMARY_KEYS if key not in data]
+    if missing:
+        raise ValueError(f"The analysis is missing {', '.join(missing)}.")
+
+    entries = []
+    for entry in data.get("sentences", []):
+        try:
+            entries.append(validate_entry(entry))
+        except ValueError:
+            continue
+    return {
+        **data,
+        "reviewed_text": str(data["reviewed_text"]),
+        "explanation": _strings(data["explanation"]),
+        "score": min(100.0, max(0.0, float(data["score"]))),
+        "sentences": entries,
+    }
+
+
+class AnalysisStreamParser:
+    # Tracks strings and bracket nesting character by character. Depth 2 is the analysis
+    # dictionary, so a value at depth 2 is complete at the next "," or "}", and "sentences"
+    # entries are the dictionaries that open at depth 4.
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.entries = []
+        self.sentences_closed = False
+        self.repaired = False
+
+        self._position = 0
+        self._depth = 0
+        self._quote = None
+        self._escaped = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._value_start = None
+        self._entry_start = None
+
+    def feed(self, chunk):
+        # Returns the corrections completed by this chunk.
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._position < len(text):
+            i = self._position
+            char = text[i]
+            self._position += 1
+
+            if self._quote is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self._quote:
+                    self._quote = None
+                    self._last_string = text[self._string_start:i + 1]
+                continue
+
+            if char in "\"'":
+                self._quote = char
+                self._string_start = i
+            elif char == ":" and self._depth == 2 and self._key is None:
+                self._key = self._literal(self._last_string)
+                self._value_start = i + 1
+            elif char in "[{":
+                self._depth += 1
+                if self._depth == 4 and char == "{" and self._key == "sentences":
+                    self._entry_start = i
+            elif char in "]}":
+                if self._depth == 4 and char == "}" and self._entry_start is not None:
+                    entry = self._entry(text[self._entry_start:i + 1])
+                    if entry is not None:
+                        self.entries.append(entry)
+                        completed.append(entry)
+                    self._entry_start = None
+                elif self._depth == 3 and char == "]" and self._key == "sentences":
+                    self.sentences_closed = True
+                self._depth -= 1
+                if self._depth == 1 and char == "}":
+                    self._end_value(i)
+            elif char == "," and self._depth == 2:
+                self._end_value(i)
+        return completed
+
+    def _literal(self, source):
+        try:
+            return ast.literal_eval(source) if source is not None else None
+        except (ValueError, SyntaxError):
+            return None
+
+    def _entry(self, source):
+        try:
+            return validate_entry(self._literal(source))
+        except ValueError:
+            return None
+
+    def _end_value(self, end):
+        if self._key is not None and self._key != "sentences":
+            value = self._literal(self.text[self._value_start:end].strip())
+            if value is not None:
+                self.fields[self._key] = value
+        self._key = None
+
+    def recovered(self):
+        return {**self.fields, "sentences": list(self.entries)}
+
+    def finish(self):
+        # Returns the validated analysis. A reply that does not parse as a whole but whose
+        # summary and corrections all completed is accepted as it is; otherwise PartialAnalysis
+        # says how much of it can be kept.
+        try:
+            return validate_analysis(parse_reply(self.text))
+        except (ValueError, SyntaxError, IndexError, KeyError, TypeError):
+            pass
+
+        data = self.recovered()
+        has_summary = all(key in self.fields for key in SUMMARY_KEYS)
+        if has_summary and self.sentences_closed:
+            self.repaired = True
+            return validate_analysis(data)
+
+        covered = 0
+        if has_summary:
+            numbers = [int(entry["sentence number"]) for entry in self.entries if entry["sentence number"].isdigit()]
+            covered = max(numbers, default=0)
+        raise PartialAnalysis(data, covered)
@@ -0,0 +1,192 @@
+from speakable.metrics import METRICS
+from speakable.prompts import PromptTemplate
+from speakable.structured import AnalysisStreamParser, PartialAnalysis
+
+SENTENCE_STRUCTURE = '''
+
+Provided Information starts here.
+
+**Sentence Structure**
+- Subject: Every sentence must clearly state who or what it is about.
+- Predicate: Every sentence must describe what the subject is doing or being.
+- Clause Structure: Ensure each sentence has at least one independent clause.
+
+**Grammar Correction**
+- Subject-Verb Agreement: The verb must agree in number and person with its subject.
+- Verb Tense: Use consistent and appropriate verb tenses.
+- Pronoun Usage and Agreement: Pronouns must agree with their antecedents in number and gender.
+- Article Use: Use 'a', 'an', and 'the' correctly before nouns.
+- Modifier Placement: Place adjectives and adverbs correctly to avoid confusion.
+- Punctuation: Ensure correct use of commas, periods, and other punctuation marks.
+- Capitalization: Capitalize the first word of every sentence and all proper nouns.
+- Spelling: Check all words for correct spelling.
+
+**Semantic and Logical Coherence**
+- Sentence Completeness: Each sentence should express a full, standalone thought.
+- Clarity: Avoid vague or confusing phrases.
+- Conciseness: Eliminate unnecessary words.
+- Logical Flow: Ensure ideas follow a natural, logical progression.
+
+**Style and Tone**
+- Tone and Register: Keep the tone polite and appropriate to context.
+- Sentence Variety: Use a mix of simple, compound, and complex sentences.
+- Voice (Active/Passive): Prefer active voice unless passive is contextually better.
+- Idiomatic Expressions: Use natural English phrases and collocations.
+- Parallel Structure: Use consistent grammar in lists and paired elements.
+
+Provided Information ends here.
+'''
+
+PROMPT = f''' You are an excellent English teacher, and have the following provided information about how to improve English sentences: {SENTENCE_STRUCTURE}
+
+With the information provided, please review the following text and return it with corrections. Do not change the text structure.
+
+Feel free to add or remove words or suggest different expressions if you think they will improve the clarity of the text, but do not change the text structure. Consider that the text needs to be polite and friendly.
+
+Return a **Python list of dictionaries**, where each dictionary represents a sentence. If a sentence is being corrected or does not align with the provided information, the dictionary must include the following four keys:
+- "reviewed_text": A string containing the corrected version of the sentence.
+- "explanation": A Python list of corrections made, with each entry being a short, clear reason based on the provided information.
+- "score": A number between 0 and 100 representing how well the original sentence was written.
+- "sentences": A Python list of dictionaries, each representing a corrected sentence. Each dictionary in this list must include the following five keys:
+    - "sentence number": The position of the sentence in the original text.
+    - "sentence": The original sentence.
+    - "review": The corrected or revised version of the sentence.
+    - "section": A list of the relevant section(s) from the provided information that support the correction.
+    - "subsection": A list of the relevant subsection(s) from the provided information, each with a clear description that justifies the correction based on the provided information.
+
+**Example of the explanation property:**
+"explanation": [
+    "Moved the sentence to create a better flow of information.",
+    "Changed \"too\" to \"also\" for more formal language.",
+    "Shortened \"which is something I enjoy playing\" to \"which I enjoy playing\" for conciseness.",
+    "Replaced \"it\" with \"this visit\" and \"the same as last time\" with \"as good as the last one\" for clarity and better style."
+]
+
+**Example of a dictionary in the sentences array:**
+{{
+    "sentence number": "4",
+    "sentence": "This is an incorrect sentence.",
+    "review": "This is a correct sentence.",
+    "section": ["Semantic and Logical Coherence", "Style and Tone"],
+    "subsection": [
+        "Conciseness: Removed redundant words for a more concise sentence.",
+        "Sentence Variety: Rephrased for better flow and variety.",
+        "Clarity: Clarified the meaning by removing vague phrasing.",
+        "Voice (Active/Passive): Changed to active voice for clarity and impact."
+    ]
+}}
+
+**Rules:**
+- Only use the provided information above to justify corrections.
+- Do not change the text structure and do not summarise the text unless it does not conform with the provided information.
+- Ensure that "section" values match exactly with those in the provided information. Ensure that the description of the correction is based on the provided information.
+- Ensure that the number of sentences is correct and that each sentence is numbered correctly.
+- If a sentence requires no correction, **do not include it** in the output.
+- Strictly follow the format of the examples.
+- Return only valid Python syntax with properly formatted dictionaries and lists, including all quotation marks and commas.
+'''
+
+
+CONTEXT_PROMPT = """The text to review is an excerpt of a longer document. For context only, the surrounding sentences are:
+{context}
+
+Do not review, number or return these context sentences. Number the sentences of the excerpt starting from 1."""
+
+
+# The guidelines are included once; the rules refer back to them.
+TEXT_ANALYSIS = PromptTemplate("text_analysis", PROMPT, context=CONTEXT_PROMPT)
+
+
+def build_messages(text, context=None):
+    return TEXT_ANALYSIS.build(text, context)
+
+
+def match_entries(entries, sentences):
+    # Maps the model's entries onto positions in sentences, using "sentence number" first and
+    # falling back to the original sentence text when the number is missing or out of range.
+    matched = {}
+    positions = {" ".join(sentence.split()): i for i, sentence in enumerate(sentences)}
+    for entry in entries:
+        try:
+            index = int(str(entry.get("sentence number", "")).strip()) - 1
+        except ValueError:
+            index = -1
+        if not 0 <= index < len(sentences) or index in matched:
+            index = positions.get(" ".join(str(entry.get("sentence", "")).split()), -1)
+        if index >= 0 and index not in matched:
+            matched[index] = entry
+    return matched
+
+
+def _feed(parser, content, on_entry):
+    for entry in parser.feed(content):
+        if on_entry is not None:
+            on_entry(entry)
+
+
+def _finish(parser, model):
+    try:
+        data = parser.finish()
+    except PartialAnalysis:
+        METRICS.inc("parse_failures_total", model=model)
+        raise
+    if parser.repaired:
+        METRICS.inc("parse_repairs_total", model=model)
+    return data
+
+
+def _cache_key(cache, model, text, context):
+    if cache is None:
+        return None
+    return cache.key(model, PROMPT, f"{context}\0{text}" if context else text)
+
+
+def _cached(cache, key, on_entry):
+    data = cache.get(key) if key is not None else None
+    if data is not None and on_entry is not None:
+        for entry in data.get("sentences", []):
+            on_entry(entry)
+    return data
+
+
+# With on_entry the reply is streamed and on_entry is called with every correction as soon as it
+# is complete. Replies that break off raise PartialAnalysis with the part that can be kept.
+def analyse_text(llm, model, text, cache=None, context=None, on_entry=None):
+    key = _cache_key(cache, model, text, context)
+    data = _cached(cache, key, on_entry)
+    if data is not None:
+        return data
+
+    parser = AnalysisStreamParser()
+    messages = build_messages(text, context)
+    if on_entry is None:
+        _feed(parser, llm.invoke(messages).content, on_entry)
+    else:
+        for chunk in llm.stream(messages):
+            _feed(parser, chunk.content, on_entry)
+    data = _finish(parser, model)
+
+    # Only complete responses are cached, so a malformed one is retried on the next click.
+    if key is not None:
+        cache.set(key, data)
+    return data
+
+
+async def aanalyse_text(llm, model, text, cache=None, context=None, on_entry=None):
+    key = _cache_key(cache, model, text, context)
+    data = _cached(cache, key, on_entry)
+    if data is not None:
+        return data
+
+    parser = AnalysisStreamParser()
+    messages = build_messages(text, context)
+    if on_entry is None:
+        _feed(parser, (await llm.ainvoke(messages)).content, on_entry)
+    else:
+        async for chunk in llm.astream(messages):
+            _feed(parser, chunk.content, on_entry)
+    data = _finish(parser, model)
+
+    if key is not None:
+        cache.set(key, data)
+    return data
@@ -0,0 +1,149 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+from speakable.cache import CACHE_DIR, cache_key
+from speakable.metrics import METRICS
+
+
+class GTTSBackend:
+    name = "gtts"
+    format = "mp3"
+
+    def synthesize(self, text, language="en", voice=None):
+        from gtts import gTTS
+
+        buffer = BytesIO()
+        gTTS(text, lang=language, tld=voice or "com").write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class EspeakBackend:
+    # Runs locally, so the page works offline and synthesis can be benchmarked without network.
+    name = "espeak"
+    format = "wav"
+
+    def __init__(self):
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.executable is None:
+            raise RuntimeError("espeak-ng or espeak must be installed to use the espeak TTS backend.")
+
+    def synthesize(self, text, language="en", voice=None):
+        # The text goes in on stdin so that text starting with "-" is not read as an option.
+        result = subprocess.run(
+            [self.executable, "--stdout", "--stdin", "-v", voice or language],
+            input=text.encode("utf-8"),
+            capture_output=True,
+            check=True
+        )
+        return result.stdout
+
+
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend,
+}
+
+
+class AudioStore:
+    # Content-addressed clips on disk. The directory is kept under max_bytes by deleting the
+    # least recently read clips first; reads bump a clip's modification time.
+
+    def __init__(self, directory=os.path.join(CACHE_DIR, "tts"), max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key, extension):
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def get(self, key, extension):
+        path = self.path(key, extension)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            METRICS.inc("cache_lookups_total", cache="tts", result="miss")
+            return None
+        self.hits += 1
+        METRICS.inc("cache_lookups_total", cache="tts", result="disk_hit")
+        return data
+
+    def put(self, key, extension, data):
+        descriptor, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(key, extension))
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+class Synthesizer:
+    def __init__(self, backend, store, language="en", voice=None, max_workers=4):
+        self.backend = backend
+        self.store = store
+        self.language = language
+        self.voice = voice
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speakable-tts")
+
+    @property
+    def format(self):
+        return self.backend.format
+
+    def key(self, sentence):
+        return cache_key(self.backend.name, self.language, self.voice, sentence)
+
+    def synthesize(self, sentence):
+        key = self.key(sentence)
+        data = self.store.get(key, self.backend.format)
+        if data is None:
+            data = self._render(sentence, key)
+        return data
+
+    def _render(self, sentence, key):
+        with METRICS.span("tts_synthesize", backend=self.backend.name):
+            data = self.backend.synthesize(sentence, self.language, self.voice)
+        METRICS.inc("tts_chars_total", len(sentence), backend=self.backend.name)
+        self.store.put(key, self.backend.format, data)
+        return data
+
+    def synthesize_many(self, sentences):
+        # Yields (index, audio bytes) as clips become available: cached clips straight away,
+        # the rest as the worker pool finishes them.
+        cached, futures = [], {}
+        for index, sentence in enumerate(sentences):
+            key = self.key(sentence)
+            data = self.store.get(key, self.backend.format)
+            if data is not None:
+                cached.append((index, data))
+            else:
+                futures[self.pool.submit(self._render, sentence, key)] = index
+
+        yield from cached
+        for future in as_completed(futures):
+            yield futures[future], future.result()
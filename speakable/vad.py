@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+import numpy as np
+
+from speakable.inference import SAMPLE_RATE
+
+Speech = namedtuple("Speech", ["segments", "speech_samples", "total_samples", "threshold_db"])
+
+
+def frame_energies(samples, frame_samples):
+    frames = len(samples) // frame_samples
+    if frames == 0:
+        return np.zeros(0)
+    power = np.square(samples[:frames * frame_samples].reshape(frames, frame_samples), dtype=np.float64).mean(axis=1)
+    return 10 * np.log10(power + 1e-12)
+
+
+def _dilate(mask, width):
+    # Extends every speech frame by width frames on both sides.
+    if width <= 0 or not mask.any():
+        return mask
+    counts = np.convolve(mask.astype(np.int32), np.ones(2 * width + 1, dtype=np.int32), mode="same")
+    return counts > 0
+
+
+def detect_speech(
+    samples,
+    frame_ms=20,
+    margin_db=15.0,
+    floor_db=-55.0,
+    padding_ms=150,
+    min_speech_ms=100,
+    split_pause_ms=600
+):
+    # Energy-based voice activity detection. A frame is speech when it is margin_db above the
+    # noise floor (the 10th percentile of frame energies) and above floor_db. Speech runs are
+    # padded by padding_ms, pauses shorter than split_pause_ms are bridged and runs shorter than
+    # min_speech_ms are dropped. With split_pause_ms=0 the whole speech region is one segment.
+    frame_samples = int(SAMPLE_RATE * frame_ms / 1000)
+    energies = frame_energies(np.asarray(samples, dtype=np.float32), frame_samples)
+    if not len(energies):
+        return Speech([], 0, len(samples), floor_db)
+
+    threshold = max(float(np.percentile(energies, 10)) + margin_db, floor_db)
+    mask = _dilate(energies > threshold, int(padding_ms / frame_ms))
+
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    runs = [[start, end] for start, end in zip(edges[::2], edges[1::2])]
+
+    if split_pause_ms:
+        bridge = int(split_pause_ms / frame_ms)
+        merged = []
+        for run in runs:
+            if merged and run[0] - merged[-1][1] < bridge:
+                merged[-1][1] = run[1]
+            else:
+                merged.append(run)
+        runs = merged
+    elif runs:
+        runs = [[runs[0][0], runs[-1][1]]]
+
+    min_frames = int(min_speech_ms / frame_ms)
+    segments = [
+        (int(start) * frame_samples, min(len(samples), int(end) * frame_samples))
+        for start, end in runs
+        if end - start >= min_frames
+    ]
+    return Speech(segments, sum(end - start for start, end in segments), len(samples), threshold)
+
+
+def speech_stats(speech):
+    total = speech.total_samples / SAMPLE_RATE
+    kept = speech.speech_samples / SAMPLE_RATE
+    return {
+        "segments": len(speech.segments),
+        "audio_seconds": round(total, 2),
+        "speech_seconds": round(kept, 2),
+        "compute_saved": round(1 - kept / total, 3) if total else 0.0,
+        "threshold_db": round(speech.threshold_db, 1),
+    }
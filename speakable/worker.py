@@ -0,0 +1,235 @@
+import argparse
+import logging
+import os
+import secrets
+import socket
+import stat
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import AuthenticationError, resource_tracker
+from multiprocessing.connection import Client, Listener, answer_challenge, deliver_challenge
+from multiprocessing.shared_memory import SharedMemory
+from types import SimpleNamespace
+
+import numpy as np
+
+from speakable.inference import MODEL_ID, Recognition
+
+logger = logging.getLogger(__name__)
+
+# Seconds a client gets to complete the authentication handshake.
+HANDSHAKE_TIMEOUT = 5
+
+# An optional inference worker process. It loads the speech model once, with the safetensors
+# weights memory-mapped, and serves phoneme recognition to every app process on the machine over
+# a local socket. Audio travels through shared memory; only its name and length go over the
+# socket.
+#
+#   python -m speakable.worker
+#
+# Connections are authenticated both ways with a secret key, since multiprocessing.connection
+# unpickles whatever the other side sends. The key comes from SPEAKABLE_WORKER_AUTHKEY or, when
+# that is unset, from a file the worker generates in a directory only this user can read.
+
+
+def runtime_dir():
+    from speakable.cache import CACHE_DIR
+
+    base = os.getenv("XDG_RUNTIME_DIR") or os.path.abspath(CACHE_DIR)
+    path = os.path.join(base, "speakable")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    _check_private(path)
+    return path
+
+
+def _check_private(path):
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or stat.S_IMODE(info.st_mode) & 0o077:
+        raise PermissionError(f"{path} must be owned by this user and not accessible to anyone else.")
+
+
+def default_address():
+    return os.path.join(runtime_dir(), "worker.sock")
+
+
+def _authkey_path():
+    return os.path.join(runtime_dir(), "worker.key")
+
+
+def _authkey(create=False):
+    key = os.getenv("SPEAKABLE_WORKER_AUTHKEY")
+    if key:
+        return key.encode("utf-8")
+
+    path = _authkey_path()
+    if create and not os.path.exists(path):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    # Raises FileNotFoundError (an OSError, so clients fall back) when no worker has created it.
+    _check_private(path)
+    with open(path) as f:
+        return f.read().strip().encode("utf-8")
+
+
+def _attach(name):
+    shared = SharedMemory(name=name)
+    # The client owns the segment; without this the worker's resource tracker would unlink it too.
+    resource_tracker.unregister(shared._name, "shared_memory")
+    return shared
+
+
+def _receive_timeout(connection, seconds):
+    # A kernel receive timeout on the socket, so a stalled client makes reads fail with an OSError.
+    # 0 turns it off again.
+    sock = socket.socket(fileno=os.dup(connection.fileno()))
+    with sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack("ll", seconds, 0))
+
+
+def _authenticate(connection, authkey):
+    # The same handshake Listener(authkey=...) runs in accept(), but on the connection's own
+    # thread, so a slow or hostile client cannot hold up the others.
+    _receive_timeout(connection, HANDSHAKE_TIMEOUT)
+    try:
+        deliver_challenge(connection, authkey)
+        answer_challenge(connection, authkey)
+    finally:
+        _receive_timeout(connection, 0)
+
+
+def _handle(connection, engine, authkey):
+    with connection:
+        try:
+            _authenticate(connection, authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            logger.warning("Rejected a worker connection: %r", e)
+            return
+        request = connection.recv()
+        try:
+            if request[0] == "stats":
+                connection.send(("ok", engine.stats()))
+                return
+
+            _, name, length = request
+            shared = _attach(name)
+            try:
+                samples = np.ndarray((length,), dtype=np.float32, buffer=shared.buf)
+                text, logits = engine.recognize(samples)
+                del samples
+            finally:
+                shared.close()
+            connection.send(("ok", text, logits.numpy()))
+        except Exception as e:
+            connection.send(("error", repr(e)))
+
+
+def serve(address=None):
+    from transformers import Wav2Vec2ForCTC, Wav2Vec2Processor
+
+    from speakable.backends import load_backend
+    from speakable.inference import BatchingEngine
+
+    processor = Wav2Vec2Processor.from_pretrained(MODEL_ID)
+    model = load_backend(
+        os.getenv("SPEAKABLE_BACKEND", "fp32"),
+        Wav2Vec2ForCTC.from_pretrained(MODEL_ID, use_safetensors=True),
+        num_threads=os.getenv("SPEAKABLE_NUM_THREADS")
+    )
+    engine = BatchingEngine(
+        processor,
+        model,
+        max_batch_size=int(os.getenv("SPEAKABLE_MAX_BATCH_SIZE", "8")),
+        max_wait_ms=float(os.getenv("SPEAKABLE_MAX_WAIT_MS", "50"))
+    )
+
+    address = address or default_address()
+    authkey = _authkey(create=True)
+    if os.path.exists(address):
+        os.remove(address)
+    # The listener accepts raw connections; each one is authenticated in its handler thread.
+    with Listener(address, family="AF_UNIX") as listener:
+        print(f"Speakable inference worker listening on {address}")
+        while True:
+            try:
+                connection = listener.accept()
+            except OSError as e:
+                logger.warning("Could not accept a worker connection: %r", e)
+                continue
+            threading.Thread(target=_handle, args=(connection, engine, authkey), daemon=True).start()
+
+
+class WorkerClient:
+    # Speaks the BatchingEngine interface (submit, recognize, stats, processor, model.config) but
+    # runs inference in the worker process. When the worker cannot be reached, requests go to the
+    # engine returned by fallback instead.
+
+    def __init__(self, address, fallback, max_workers=8):
+        from transformers import AutoConfig, Wav2Vec2Processor
+
+        self.address = address
+        self.fallback = fallback
+        self.processor = Wav2Vec2Processor.from_pretrained(MODEL_ID)
+        self.model = SimpleNamespace(config=AutoConfig.from_pretrained(MODEL_ID))
+        self.worker_failures = 0
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speakable-worker-client")
+
+    def _request(self, request):
+        with Client(self.address, family="AF_UNIX", authkey=_authkey()) as connection:
+            connection.send(request)
+            response = connection.recv()
+        if response[0] == "error":
+            raise RuntimeError(f"Inference worker failed: {response[1]}")
+        return response[1:]
+
+    def recognize(self, waveform, timeout=None):
+        import torch
+
+        waveform = np.asarray(waveform, dtype=np.float32)
+        try:
+            shared = SharedMemory(create=True, size=max(1, waveform.nbytes))
+        except OSError:
+            return self.fallback().recognize(waveform, timeout)
+
+        try:
+            np.ndarray(waveform.shape, dtype=np.float32, buffer=shared.buf)[:] = waveform
+            text, logits = self._request(("recognize", shared.name, len(waveform)))
+        except (OSError, EOFError, AuthenticationError):
+            self.worker_failures += 1
+            return self.fallback().recognize(waveform, timeout)
+        finally:
+            shared.close()
+            shared.unlink()
+        return Recognition(text, torch.from_numpy(logits))
+
+    def submit(self, waveform):
+        return self._pool.submit(self.recognize, waveform)
+
+    def stats(self):
+        try:
+            stats, = self._request(("stats",))
+        except (OSError, EOFError, AuthenticationError):
+            return {"worker": "unreachable", "worker_failures": self.worker_failures}
+        return {"worker": self.address, "worker_failures": self.worker_failures, **stats}
+
+
+def worker_available(address):
+    try:
+        with Client(address, family="AF_UNIX", authkey=_authkey()) as connection:
+            connection.send(("stats",))
+            connection.recv()
+    except (OSError, EOFError, AuthenticationError):
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Speakable phoneme recognition to local app processes.")
+    parser.add_argument("--address", default=os.getenv("SPEAKABLE_WORKER_ADDRESS"), help="Defaults to worker.sock in a private runtime directory.")
+    args = parser.parse_args()
+    serve(args.address)
+
+
+if __name__ == "__main__":
+    main()
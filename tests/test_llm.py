@@ -0,0 +1,109 @@
+import pytest
+
+from speakable.fake_llm import fake_factory
+from speakable.llm import CircuitBreaker, ModelRouter, TokenBucket
+from speakable.service import router_from_env
+
+MESSAGES = [("system", "Review the text."), ("human", "I has a apple.")]
+
+
+def make_router(overrides=None, **options):
+    return ModelRouter(models=["primary", "secondary"], factory=fake_factory(overrides), **options)
+
+
+def serve(router, preferred="primary"):
+    served_by = []
+    router.invoke(MESSAGES, preferred, served_by)
+    return served_by[0]
+
+
+def test_quota_error_falls_back_to_next_model():
+    router = make_router({"primary": {"fail_first": 1}})
+
+    assert serve(router) == "secondary"
+    assert router.fallbacks == 1
+    assert router.quota_errors["primary"] == 1
+    assert router.breakers["primary"].state == CircuitBreaker.OPEN
+
+
+def test_open_circuit_skips_model_until_cooldown():
+    router = make_router({"primary": {"fail_first": 1}}, cooldown=60)
+    serve(router)
+
+    assert serve(router) == "secondary"
+    assert router.chat_model("primary").calls == 1
+
+
+def test_breaker_half_opens_after_cooldown_and_closes_on_success():
+    breaker = CircuitBreaker(cooldown=60)
+    breaker.record_quota_error()
+    assert not breaker.allow()
+
+    breaker.opened -= 60
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only a single trial request goes through while half open.
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_reopens_when_trial_hits_quota():
+    breaker = CircuitBreaker(cooldown=60)
+    breaker.record_quota_error()
+    breaker.opened -= 60
+    assert breaker.allow()
+
+    breaker.record_quota_error()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_trial_closes_circuit_through_router():
+    router = make_router({"primary": {"fail_first": 1}}, cooldown=60)
+    serve(router)
+    router.breakers["primary"].opened -= 60
+
+    assert serve(router) == "primary"
+    assert router.breakers["primary"].state == CircuitBreaker.CLOSED
+
+
+def test_empty_token_bucket_skips_model():
+    router = make_router(requests_per_minute=15)
+    router.buckets["primary"].tokens = 0
+
+    assert serve(router) == "secondary"
+    assert router.chat_model("primary").calls == 0
+    # A model skipped for its rate limit keeps its circuit closed.
+    assert router.breakers["primary"].state == CircuitBreaker.CLOSED
+
+
+def test_token_bucket_reports_wait_until_next_token():
+    bucket = TokenBucket(60, burst=1)
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    assert 0 < bucket.wait_time() <= 1
+
+
+def test_zero_rate_is_unlimited():
+    bucket = TokenBucket(0)
+    assert all(bucket.try_acquire() for _ in range(100))
+    assert bucket.wait_time() == 0.0
+
+    router = make_router(requests_per_minute=0)
+    assert all(serve(router) == "primary" for _ in range(20))
+
+
+def test_zero_model_rpm_from_env(monkeypatch):
+    monkeypatch.setenv("SPEAKABLE_MODEL_RPM", "0")
+    router = router_from_env()
+    router.factory = fake_factory()
+
+    assert all(serve(router, router.models[0]) == router.models[0] for _ in range(20))
+
+
+def test_negative_rate_is_rejected():
+    with pytest.raises(ValueError):
+        TokenBucket(-1)
@@ -0,0 +1,84 @@
+import pytest
+
+from speakable.fanout import chunk_indices
+from speakable.prompts import CHARS_PER_TOKEN, PromptTemplate, PromptTooLarge, count_tokens, prompt_size
+
+PREFIX = "Review every sentence of the text."
+CONTEXT = "Surrounding text, for reference only: {context}"
+
+
+def test_count_tokens_ascii():
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+    assert count_tokens("a" * 4 * 100) == 100
+
+
+def test_count_tokens_counts_each_non_ascii_character():
+    assert count_tokens("ɪŋ") == 2
+    assert count_tokens("sɪŋ ɪt") == 1 + 3
+
+
+def test_prompt_size_splits_prefix_from_request():
+    size = prompt_size([("system", "a" * 40), ("system", "b" * 8), ("human", "c" * 4)])
+    assert size == {"prefix_tokens": 10, "request_tokens": 3, "total_tokens": 13}
+
+
+def test_budget_is_read_from_environment(monkeypatch):
+    template = PromptTemplate("test", PREFIX)
+    monkeypatch.setenv("SPEAKABLE_PROMPT_BUDGET", "123")
+    assert template.budget == 123
+    assert PromptTemplate("test", PREFIX, budget=50).budget == 50
+
+
+def test_chunks_sized_by_request_chars_fit_budget():
+    template = PromptTemplate("test", PREFIX, budget=100)
+    sentences = [f"This is sentence number {i} of a long text." for i in range(60)]
+
+    chunks = chunk_indices(sentences, range(len(sentences)), template.request_chars())
+
+    assert len(chunks) > 1
+    assert sorted(i for chunk in chunks for i in chunk) == list(range(len(sentences)))
+    for chunk in chunks:
+        messages = template.build(" ".join(sentences[i] for i in chunk))
+        assert prompt_size(messages)["total_tokens"] <= template.budget
+
+
+def test_request_chars_leaves_room_for_context():
+    template = PromptTemplate("test", PREFIX, budget=100)
+    room = (template.budget - template.prefix_tokens) * CHARS_PER_TOKEN
+    assert template.request_chars() == int((template.budget - template.prefix_tokens) * 0.75) * CHARS_PER_TOKEN
+    assert template.request_chars(reserve=0) == room
+
+
+def test_no_budget_means_no_limit():
+    template = PromptTemplate("test", PREFIX, budget=0)
+    assert template.request_chars() is None
+    assert template.build("a" * 100000)[-1] == ("human", "a" * 100000)
+
+
+def test_context_is_kept_when_it_fits():
+    template = PromptTemplate("test", PREFIX, context=CONTEXT, budget=100)
+    messages = template.build("I has a apple.", context="She eat it.")
+    assert messages == [
+        ("system", PREFIX),
+        ("system", CONTEXT.format(context="She eat it.")),
+        ("human", "I has a apple."),
+    ]
+
+
+def test_context_is_dropped_when_it_does_not_fit():
+    template = PromptTemplate("test", PREFIX, context=CONTEXT, budget=100)
+    messages = template.build("I has a apple.", context="She eat it. " * 100)
+    assert messages == [("system", PREFIX), ("human", "I has a apple.")]
+
+
+def test_single_oversized_sentence_raises():
+    template = PromptTemplate("test", PREFIX, context=CONTEXT, budget=100)
+    sentence = "This sentence goes on and on " * 20
+
+    # chunk_indices never splits a sentence, so one that is too long gets a chunk of its own.
+    chunks = chunk_indices([sentence], [0], template.request_chars())
+    assert chunks == [[0]]
+    with pytest.raises(PromptTooLarge):
+        template.build(sentence, context="Short context.")